@@ -1,5 +1,7 @@
 from fastapi import FastAPI, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse, JSONResponse
+from middleware.db_metrics import add_db_metrics
 from middleware.cors import add_cors
 from security.authorization import authorization
 from routes.v1.auth.auth import router as Auth
@@ -8,9 +10,19 @@ from routes.v1.openai.streaming import router as Streaming
 from routes.v1.openai.completion import router as Completion
 from routes.v1.user.user import router as UserData
 from routes.v1.chat.chat import router as ChatRoute
+from services.indexes import ensure_indexes
+from services.system_prompts import system_prompts
+from services.use_counts import use_counts
+from services.quota import query_quota
+from services.titles import title_jobs
+from services.speech import speech_synthesizer
+from services.image_pipeline import image_pipeline
+from services.metrics import collect_metrics, metrics_reporter
+from services.upstream import upstream
 
 app = FastAPI()
 add_cors(app=app)
+add_db_metrics(app=app)
 
 
 app.include_router(router=Streaming, prefix="/api/v1")
@@ -29,6 +41,40 @@ app.include_router(
 )
 
 
+@app.on_event("startup")
+def startup():
+    """
+    Ensure database indexes and load cached collections
+    """
+    ensure_indexes()
+    system_prompts.refresh()
+    use_counts.start()
+    metrics_reporter.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    Write pending counters and titles, give back reserved queries, stop
+    speech and image workers and close upstream connections
+    """
+    await run_in_threadpool(metrics_reporter.stop)
+    await run_in_threadpool(use_counts.stop)
+    await run_in_threadpool(query_quota.release_all)
+    await run_in_threadpool(title_jobs.shutdown)
+    await run_in_threadpool(speech_synthesizer.shutdown)
+    await run_in_threadpool(image_pipeline.shutdown)
+    await upstream.close()
+
+
+@app.get("/api/v1/metrics", dependencies=[Depends(dependency=authorization)])
+def metrics():
+    """
+    Service counters of the worker that answers
+    """
+    return collect_metrics()
+
+
 @app.get("/api/v1")
 def home():
     """
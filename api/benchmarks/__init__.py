@@ -0,0 +1,5 @@
+"""
+Benchmarks are run from the api dir, e.g. python -m benchmarks.question_stream,
+with the stand-ins the tests use for the deployment modules
+"""
+import tests.conftest  # noqa: F401
@@ -0,0 +1,127 @@
+"""
+Load benchmark of POST /chat/question/ against a local fake upstream.
+
+The fake upstream streams OpenAI chunks at a fixed pace, so every answer
+takes about tokens * delay. The route keeps its real upstream client, SSE
+framing and collector, only the chat tail read and the message writes
+are replaced. Streams are not held back by a thread or connection limit,
+so every stream is in flight at once and a run takes about as long as
+one answer until the CPU, shared with the fake upstream, is saturated
+(cpu s close to total s).
+
+    python -m benchmarks.question_stream --streams 50 200 1000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import httpx
+import openai
+from aiohttp import web
+from fastapi import FastAPI
+
+# the route's upstream client talks to the fake upstream through openai
+sys.modules["config.openai"].openai = openai
+
+from routes.v1.chat import chat  # noqa: E402
+from security.authorization import get_user  # noqa: E402
+from services.upstream import upstream  # noqa: E402
+
+
+def chunk(delta):
+    return {"choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+
+
+def event(data):
+    return f"data: {json.dumps(data)}\n\n".encode()
+
+
+def fake_upstream(tokens, delay):
+    async def completions(request):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(event(chunk({"role": "assistant"})))
+        for position in range(tokens):
+            await asyncio.sleep(delay)
+            await response.write(event(chunk({"content": f" token{position}"})))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    return app
+
+
+def question_app():
+    async def load_question_context(samurai_id, chat_id):
+        return {"messages": [], "chat_prompt": None, "last_message_id": 2}
+
+    def insert_message(*args, **kwargs):
+        pass
+
+    chat.load_question_context = load_question_context
+    chat.insert_message = insert_message
+    app = FastAPI()
+    app.include_router(chat.router)
+    app.dependency_overrides[get_user] = lambda: {"samurai_id": "benchmark"}
+    return app
+
+
+async def ask(client, position):
+    started = time.perf_counter()
+    response = await client.post(
+        "/chat/question/",
+        json={"chat_id": f"chat-{position}", "question": "benchmark"},
+    )
+    assert response.status_code == 200, response.text
+    assert "event: done" in response.text
+    return time.perf_counter() - started
+
+
+async def run(streams, tokens, delay):
+    runner = web.AppRunner(fake_upstream(tokens, delay))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    openai.api_base = f"http://127.0.0.1:{port}/v1"
+    openai.api_key = "benchmark"
+
+    transport = httpx.ASGITransport(app=question_app())
+    print(f"one answer: {tokens} tokens, about {tokens * delay:.2f}s")
+    print(
+        f"{'streams':>8} {'total s':>8} {'cpu s':>7} {'p50 s':>7} {'p99 s':>7} "
+        f"{'max in flight':>14}"
+    )
+    try:
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark", timeout=None
+        ) as client:
+            for count in streams:
+                upstream.metrics.clear()
+                started, cpu_started = time.perf_counter(), time.process_time()
+                latencies = sorted(
+                    await asyncio.gather(*(ask(client, n) for n in range(count)))
+                )
+                total = time.perf_counter() - started
+                cpu = time.process_time() - cpu_started
+                p50 = statistics.median(latencies)
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                print(
+                    f"{count:>8} {total:>8.2f} {cpu:>7.2f} {p50:>7.2f} {p99:>7.2f} "
+                    f"{upstream.snapshot()['max_in_flight']:>14}"
+                )
+    finally:
+        await upstream.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--streams", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--delay", type=float, default=0.02)
+    arguments = parser.parse_args()
+    asyncio.run(run(arguments.streams, arguments.tokens, arguments.delay))
@@ -0,0 +1,67 @@
+"""
+Microbenchmark of collecting a streamed answer, string concatenation as
+the stream generators used to do against StreamCollector.
+
+    python -m benchmarks.stream_collector --tokens 4000
+"""
+import argparse
+import timeit
+from services.stream_collector import StreamCollector
+
+
+def chunks(tokens):
+    return [
+        {"choices": [{"delta": {"content": f" token{position}"}}]}
+        for position in range(tokens)
+    ]
+
+
+def concatenate(stream):
+    complete_answer = ""
+    for chunk in stream:
+        delta = chunk["choices"][0]["delta"]
+        if "content" in delta:
+            complete_answer += delta["content"]
+    return complete_answer, len(stream)
+
+
+def collect(stream):
+    collector = StreamCollector()
+    for chunk in stream:
+        collector.add_chunk(chunk)
+    return collector.answer, collector.token_count
+
+
+def held_concatenate(stream):
+    """
+    Concatenation while another reference to the answer is alive, as when
+    it is also kept by a frame or a closure, CPython then copies it on
+    every token
+    """
+    complete_answer = held = ""
+    for chunk in stream:
+        delta = chunk["choices"][0]["delta"]
+        if "content" in delta:
+            complete_answer += delta["content"]
+            held = complete_answer
+    return held, len(stream)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tokens", type=int, nargs="+", default=[1000, 4000, 16000])
+    parser.add_argument("--repeat", type=int, default=200)
+    arguments = parser.parse_args()
+    print(f"{'tokens':>8} {'function':>18} {'µs per answer':>14}")
+    for tokens in arguments.tokens:
+        stream = chunks(tokens)
+        assert collect(stream) == concatenate(stream) == held_concatenate(stream)
+        for function in (concatenate, held_concatenate, collect):
+            runs = timeit.repeat(
+                lambda: function(stream), number=arguments.repeat, repeat=5
+            )
+            seconds = min(runs)
+            print(
+                f"{tokens:>8} {function.__name__:>18} "
+                f"{seconds / arguments.repeat * 1e6:>14.1f}"
+            )
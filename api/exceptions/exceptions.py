@@ -114,6 +114,13 @@ def chat_id_not_found_error():
     )
 
 
+def system_prompt_not_found_error():
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="System prompt not found for this category and sub category",
+    )
+
+
 def message_not_found_error():
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
@@ -121,6 +128,13 @@ def message_not_found_error():
     )
 
 
+def invalid_cursor_error():
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid cursor, use next_cursor from the previous page",
+    )
+
+
 def invalid_file_format_error():
     raise HTTPException(
         status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
@@ -151,3 +165,17 @@ def incorrect_style_error():
 
 def video_generation_error(error):
     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+
+def file_too_large_error():
+    raise HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail="File is too large",
+    )
+
+
+def video_too_large_error():
+    raise HTTPException(
+        status_code=status.HTTP_502_BAD_GATEWAY,
+        detail="Generated video is too large to store",
+    )
@@ -0,0 +1,76 @@
+from contextvars import ContextVar
+from pymongo import monitoring
+
+# counter of the request being served, None outside requests
+db_round_trips: ContextVar = ContextVar("db_round_trips", default=None)
+
+
+class RoundTripCounter:
+    def __init__(self):
+        self.count = 0
+
+
+class CommandCounter(monitoring.CommandListener):
+    """
+    Counts every command sent to Mongo against the current request
+    """
+
+    def started(self, event):
+        counter = db_round_trips.get()
+        if counter is not None:
+            counter.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# listeners only apply to clients created afterwards, so this module has to
+# be imported before database.database
+monitoring.register(CommandCounter())
+
+
+def get_round_trips():
+    """
+    Mongo commands sent so far while serving the current request
+    """
+    counter = db_round_trips.get()
+    return 0 if counter is None else counter.count
+
+
+class DBMetricsMiddleware:
+    """
+    Reports Mongo commands sent before the response started in the
+    X-DB-Round-Trips header
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        counter = RoundTripCounter()
+        token = db_round_trips.set(counter)
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-round-trips", str(counter.count).encode()))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            db_round_trips.reset(token)
+
+
+def add_db_metrics(app):
+    """
+    Adds Mongo round trip counting
+    """
+    app.add_middleware(DBMetricsMiddleware)
@@ -0,0 +1,9 @@
+from get_logger import logger
+from services.message_store import ensure_indexes, migrate_embedded_messages
+
+# run after the new API is deployed, it reads messages still kept in chat
+# documents until their chat is migrated
+if __name__ == "__main__":
+    ensure_indexes()
+    migrated = migrate_embedded_messages()
+    logger.info(f"moved messages of {migrated} chats to samuraiChatMessages")
@@ -2,7 +2,7 @@ import datetime
 from pydantic import BaseModel
 from helper.utils import get_time
 from database.database import samuraiUser
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 from datetime import datetime
 
 
@@ -14,7 +14,8 @@ class ChatDetails:
     chat_sub_category_id: int
     chat_id: str = None
     chat_title: str = None
-    messages: list = field(default_factory=list)
+    last_message_id: int = 0
+    message_count: int = 0
     created_at: datetime = get_time()
     updated_at: datetime = get_time()
 
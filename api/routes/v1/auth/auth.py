@@ -1,7 +1,7 @@
 from uuid import uuid4
 from fastapi import APIRouter, status, Depends
 from config.settings import settings
-from security.authorization import get_user
+from security.authorization import get_user, invalidate_token_cache
 from models.payload import (
     SignUpSchema,
     DeviceSignUp,
@@ -108,6 +108,7 @@ def device_signup(payload: DeviceSignUp):
     samuraiUserToken.update_one(
         {"samurai_id": samurai_id}, {"$set": token}, upsert=True
     )
+    invalidate_token_cache(samurai_id)
     return token
 
 
@@ -122,6 +123,7 @@ def device_login(payload: DeviceSignUp):
         account_does_not_exist_error()
     token = {"access_token": create_access_token(db_user["samurai_id"])}
     samuraiUserToken.update_one({"samurai_id": db_user["samurai_id"]}, {"$set": token})
+    invalidate_token_cache(db_user["samurai_id"])
     return token
 
 
@@ -158,6 +160,7 @@ def login(payload: LoginSchema):
     samuraiUserToken.update_one(
         {"samurai_id": db_user["samurai_id"]}, {"$set": token}, upsert=True
     )
+    invalidate_token_cache(db_user["samurai_id"])
     return token
 
 
@@ -298,6 +301,7 @@ def user_logout(current_user=Depends(get_user)):
     if db_user is None:
         account_does_not_exist_error()
     samuraiUserToken.delete_one({"samurai_id": current_user["samurai_id"]})
+    invalidate_token_cache(current_user["samurai_id"])
     return {
         "status_code": status.HTTP_200_OK,
         "response_type": "SUCCESS",
@@ -317,6 +321,7 @@ def delete_user(current_user=Depends(get_user)):
     samuraiDeletedUser.insert_one(db_user)
     samuraiUser.delete_one({"samurai_id": current_user["samurai_id"]})
     samuraiUserHistory.delete_many({"samurai_id": current_user["samurai_id"]})
+    invalidate_token_cache(current_user["samurai_id"])
     return {
         "status_code": status.HTTP_200_OK,
         "response_type": "SUCCESS",
@@ -1,26 +1,37 @@
 import json
-import io
-import os
-import shutil
-import requests
+import base64
+import asyncio
+from datetime import datetime
 from uuid import uuid4
-from bson.json_util import dumps
-from fastapi import APIRouter, status, Depends, UploadFile, File, Form
+from fastapi import (
+    APIRouter,
+    status,
+    Depends,
+    UploadFile,
+    File,
+    Form,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from dataclasses import asdict
 from models.schemas import ChatDetails, MessageDetails
 from security.authorization import get_user
+from utils.responses import BSONResponse
 from models.payload import NewChatCreation, QuestionSchema, EditTitleName, Reaction
 from exceptions.exceptions import (
-    all_free_queries_used_error,
     chat_id_not_found_error,
+    system_prompt_not_found_error,
     invalid_file_format_error,
     audio_not_clear_error,
     incorrect_style_error,
     video_generation_error,
+    video_too_large_error,
     message_not_found_error,
+    invalid_cursor_error,
 )
-from PIL import Image
 from pydub import AudioSegment
 from helper.utils import (
     image_gen_model,
@@ -28,15 +39,25 @@ from helper.utils import (
     get_time,
     generate_talk,
 )
-from database.database import (
-    samuraiUser,
-    samuraiChatHistory,
-    samuraiSystemPrompts,
-)
-from config.openai import openai
+from database.database import samuraiChatHistory
 from config.settings import settings
 from config.file_upload import upload_file
 from config.google_cloud import speech_to_text, text_to_speech
+from services.context_window import build_context, count_tokens
+from services import message_store
+from services.system_prompts import system_prompts
+from services.use_counts import use_counts
+from services.quota import query_quota
+from services.titles import provisional_title, title_jobs
+from services.upstream import upstream
+from services.sse import DeltaBuffer, close_stream, sse_event
+from services.stream_collector import StreamCollector
+from services.audio_ingest import AudioIngest
+from services.media_workspace import MediaWorkspace, upload_bytes
+from services.media_store import media_store
+from services.image_pipeline import image_pipeline
+from services.timing import StageTimer
+from services.speech import SentenceSplitter, speech_synthesizer
 
 router = APIRouter()
 
@@ -46,19 +67,12 @@ router = APIRouter()
 )
 def create_new_chat(payload: NewChatCreation, current_user=Depends(get_user)):
     if payload.catogeries_id:
-        all_system_prompts_for_category = samuraiSystemPrompts.find_one(
-            {"id": payload.catogeries_id}
-        )
-        for prompt in all_system_prompts_for_category["subCategories"]:
-            if prompt["id"] == payload.catogeries_sub_id:
-                system_prompt = prompt["prompt"]
-        samuraiSystemPrompts.update_one(
-            filter={
-                "id": payload.catogeries_id,
-                "subCategories.id": payload.catogeries_sub_id,
-            },
-            update={"$inc": {"subCategories.$.use_count": 1, "use_count": 1}},
+        system_prompt = system_prompts.get_prompt(
+            payload.catogeries_id, payload.catogeries_sub_id
         )
+        if system_prompt is None:
+            system_prompt_not_found_error()
+        use_counts.increment(payload.catogeries_id, payload.catogeries_sub_id)
         chat_category_id, chat_sub_category_id = (
             payload.catogeries_id,
             payload.catogeries_sub_id,
@@ -87,13 +101,12 @@ def create_new_chat(payload: NewChatCreation, current_user=Depends(get_user)):
     summary="edit title name",
 )
 async def edit_title_name(payload: EditTitleName, current_user=Depends(get_user)):
-    complete_chat = get_chat_by_id(current_user["samurai_id"], payload.chat_id)
-    if not complete_chat:
-        chat_id_not_found_error()
-    samuraiChatHistory.update_one(
+    result = samuraiChatHistory.update_one(
         filter={"samurai_id": current_user["samurai_id"], "chat_id": payload.chat_id},
         update={"$set": {"chat_title": payload.new_name}},
     )
+    if result.matched_count == 0:
+        chat_id_not_found_error()
     return {
         "status_code": status.HTTP_202_ACCEPTED,
         "response_type": "SUCCESS",
@@ -107,32 +120,25 @@ async def edit_title_name(payload: EditTitleName, current_user=Depends(get_user)
     summary="reaction for a message",
 )
 async def message_like_dislike(payload: Reaction, current_user=Depends(get_user)):
-    def get_filter(message_id):
-        return {
-            "samurai_id": current_user["samurai_id"],
-            "chat_id": payload.chat_id,
-            "messages.message_id": message_id,
-        }
-
     def update_reaction(message_id, is_liked=None):
         if is_liked is not None:
             update_operation = {
                 "$set": {
-                    "messages.$.is_liked": is_liked,
-                    "messages.$.updated_at": get_time(),
+                    "is_liked": is_liked,
+                    "updated_at": get_time(),
                 }
             }
         else:
             update_operation = {
                 "$unset": {
-                    "messages.$.is_liked": "",
+                    "is_liked": "",
                 },
                 "$set": {
-                    "messages.$.updated_at": get_time(),
+                    "updated_at": get_time(),
                 },
             }
-        samuraiChatHistory.update_one(
-            filter=get_filter(message_id), update=update_operation
+        message_store.update_message(
+            current_user["samurai_id"], payload.chat_id, message_id, update_operation
         )
 
     def generate_response(description):
@@ -143,12 +149,12 @@ async def message_like_dislike(payload: Reaction, current_user=Depends(get_user)
         }
 
     message_id = payload.message_id
-    message = samuraiChatHistory.find_one(
-        filter=get_filter(message_id), projection={"messages.$": 1}
+    message = message_store.find_message(
+        current_user["samurai_id"], payload.chat_id, message_id
     )
     if not message:
         message_not_found_error()
-    message_is_liked = message.get("messages", [{}])[0].get("is_liked", None)
+    message_is_liked = message.get("is_liked", None)
     if message_is_liked is not None:
         if message_is_liked == payload.is_liked:
             update_reaction(message_id)
@@ -167,9 +173,11 @@ async def message_like_dislike(payload: Reaction, current_user=Depends(get_user)
     summary="Deleted chat",
 )
 def delete_chat(chat_id, current_user=Depends(get_user)):
-    samuraiChatHistory.delete_one(
+    result = samuraiChatHistory.delete_one(
         filter={"samurai_id": current_user["samurai_id"], "chat_id": chat_id}
     )
+    if result.deleted_count:
+        message_store.delete_chat_messages(chat_id)
     return {
         "status_code": status.HTTP_200_OK,
         "response_type": "SUCCESS",
@@ -192,7 +200,9 @@ def chat_message(chat_id, current_user=Depends(get_user)):
         "data": {
             "chat_id": complete_chat["chat_id"],
             "chat_title": complete_chat["chat_title"],
-            "messages": complete_chat["messages"],
+            # messages of a chat not migrated yet are still in the chat document
+            "messages": complete_chat.get("messages", [])
+            + message_store.get_all_messages(chat_id),
         },
     }
 
@@ -202,14 +212,32 @@ def chat_message(chat_id, current_user=Depends(get_user)):
     status_code=status.HTTP_200_OK,
     summary="get all messages of a chat",
 )
-def get_all_chat_message(current_user=Depends(get_user)):
-    all_chats = get_complete_chat_history(current_user["samurai_id"])
-    return {
-        "status_code": status.HTTP_200_OK,
-        "response_type": "SUCCESS",
-        "description": "Complete Chat Data",
-        "data": json.loads(all_chats),
-    }
+def get_all_chat_message(
+    limit: int | None = Query(None, ge=1, le=100),
+    cursor: str | None = None,
+    preview: bool = False,
+    current_user=Depends(get_user),
+):
+    if limit is None and cursor is None:
+        # without paging arguments every chat is returned with its messages
+        content = {"data": get_complete_chat_history(current_user["samurai_id"])}
+    else:
+        chats, next_cursor = get_chat_list(
+            current_user["samurai_id"],
+            limit=limit or int(settings.get("CHAT_PAGE_SIZE", 20)),
+            cursor=cursor,
+            preview=preview,
+        )
+        content = {"data": chats, "next_cursor": next_cursor}
+    return BSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "status_code": status.HTTP_200_OK,
+            "response_type": "SUCCESS",
+            "description": "Complete Chat Data",
+            **content,
+        },
+    )
 
 
 @router.get(
@@ -246,14 +274,15 @@ def get_liked_prompts():
     summary="get all system prompts",
 )
 def get_all_chat_message():
-    cursor = samuraiSystemPrompts.find({})
-    doc: str = dumps(cursor, indent=4)
-    return {
-        "status_code": status.HTTP_200_OK,
-        "response_type": "SUCCESS",
-        "description": "Complete Chat Data",
-        "data": json.loads(doc),
-    }
+    return BSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "status_code": status.HTTP_200_OK,
+            "response_type": "SUCCESS",
+            "description": "Complete Chat Data",
+            "data": system_prompts.get_categories(),
+        },
+    )
 
 
 @router.post(
@@ -261,68 +290,80 @@ def get_all_chat_message():
     status_code=status.HTTP_201_CREATED,
     summary="Response for question",
 )
-def gpt_answer_stream(payload: QuestionSchema, current_user=Depends(get_user)):
-    db_user = samuraiUser.find_one(filter={"samurai_id": current_user["samurai_id"]})
-    check_all_queries_used(db_user)
+async def gpt_answer_stream(
+    request: Request, payload: QuestionSchema, current_user=Depends(get_user)
+):
     new_messages = []
     chat_id: str = payload.chat_id
     question: str = payload.question
-    complete_chat = get_chat_by_id(current_user["samurai_id"], chat_id)
+    complete_chat = await load_question_context(current_user["samurai_id"], chat_id)
     old_messages = complete_chat["messages"]
     chat_prompt = complete_chat["chat_prompt"]
+    message_id = complete_chat["last_message_id"]
     new_messages.append({"role": "user", "content": question})
     if old_messages != []:
-        messages_for_openai, message_id = process_old_messages(
+        messages_for_openai = process_old_messages(
             old_messages=old_messages, chat_prompt=chat_prompt
         )
         messages_for_openai.append(new_messages[-1])
     else:
         if chat_prompt is not None:
-            messages_for_openai, message_id = [
+            messages_for_openai = [
                 {"role": "system", "content": chat_prompt},
                 {"role": "user", "content": question},
-            ], 0
+            ]
         else:
-            messages_for_openai, message_id = [{"role": "user", "content": question}], 0
-
-    def msg_streamer(message, message_id, chat_id):
-        streaming_answer = openai.ChatCompletion.create(
-            model=settings["GPT_MODEL"], messages=message, stream=True
+            messages_for_openai = [{"role": "user", "content": question}]
+
+    async def msg_streamer(message, message_id, chat_id):
+        streaming_answer = await upstream.achat_completion(message, stream=True)
+        deltas = DeltaBuffer()
+        collector = StreamCollector()
+        try:
+            async for chunk in streaming_answer:
+                if "role" in chunk["choices"][0]["delta"]:
+                    if (
+                        payload.regenerate_response is True
+                        and message_id != 0
+                        and len(messages_for_openai) >= 3
+                        and payload.question == messages_for_openai[-3]["content"]
+                    ):
+                        message_id -= 2
+                    yield sse_event(
+                        "metadata", {"message_id": message_id + 2, "chat_id": chat_id}
+                    )
+                word = collector.add_chunk(chunk)
+                if word is not None:
+                    if deltas.add(word):
+                        yield sse_event("delta", {"content": deltas.flush()})
+                        if await request.is_disconnected():
+                            return
+            if deltas:
+                yield sse_event("delta", {"content": deltas.flush()})
+        finally:
+            await close_stream(streaming_answer)
+        new_messages.append(
+            {
+                "role": "assistant",
+                "content": collector.answer,
+                "token_count": collector.token_count,
+            }
         )
-        complete_answer = ""
-        for chunk in streaming_answer:
-            if "role" in chunk["choices"][0]["delta"]:
-                if (
-                    payload.regenerate_response is True
-                    and message_id != 0
-                    and payload.question == messages_for_openai[-3]["content"]
-                ):
-                    message_id -= 2
-                yield f"{message_id+2}:message_id{chat_id}:chat_id"
-            if "content" in chunk["choices"][0]["delta"]:
-                word = chunk["choices"][0]["delta"]["content"]
-                complete_answer += word
-                yield word
-            if chunk["choices"][0]["finish_reason"] == "stop":
-                continue
-        new_messages.append({"role": "assistant", "content": complete_answer})
 
-        if message_id == 0:
-            current_titles = get_all_current_titles(current_user["samurai_id"])
-            chat_title = title_generator(complete_answer, current_titles)
-        else:
-            chat_title = None
+        chat_title = provisional_title(question) if message_id == 0 else None
         if payload.regenerate_response is True:
             if (
-                len(messages_for_openai) not in [0, 1]
+                len(messages_for_openai) >= 3
                 and payload.question == messages_for_openai[-3]["content"]
             ):
-                remove_message(
+                await run_in_threadpool(
+                    remove_message,
                     samurai_id=current_user["samurai_id"],
                     chat_id=chat_id,
                     message_id=message_id + 2,
                 )
-        insert_message(
+        await run_in_threadpool(
+            insert_message,
             current_user["samurai_id"],
             chat_id,
             new_messages,
@@ -330,6 +371,11 @@ def gpt_answer_stream(payload: QuestionSchema, current_user=Depends(get_user)):
             "text",
             chat_title=chat_title,
         )
+        if chat_title is not None:
+            title_jobs.submit(
+                current_user["samurai_id"], chat_id, collector.answer, chat_title
+            )
+        yield sse_event("done", {"message_id": message_id + 2, "chat_id": chat_id})
 
     return StreamingResponse(
         content=msg_streamer(messages_for_openai, message_id, chat_id),
@@ -338,35 +384,20 @@ def gpt_answer_stream(payload: QuestionSchema, current_user=Depends(get_user)):
     )
 
 
-def get_all_current_titles(samurai_id):
-    all_chats = samuraiChatHistory.find({"samurai_id": samurai_id})
-    current_titles = []
-    for chat in all_chats:
-        current_titles.append(chat["chat_title"])
-    return current_titles
-
-
-def title_generator(paragraph, current_titles=None):
-    title_prompt = "generate a topic name for given paragraphs, topic or title should be less than 6 words, and should give a basic sum up of the paragraph."
-    if current_titles is not None:
-        title_prompt = f"{title_prompt} also make sure title or topic name is not one of these {current_titles}"
-    messages = [
-        {"role": "system", "content": title_prompt},
-        {"role": "user", "content": paragraph},
-    ]
-    answer = openai.ChatCompletion.create(
-        model=settings["GPT_MODEL"], messages=messages
-    )
-    title = answer["choices"][0]["message"]["content"]
-    return title.replace('"', "")
-
-
 def remove_message(samurai_id, chat_id, message_id):
+    deleted = message_store.delete_messages(chat_id, [message_id, message_id - 1])
+    # chats not migrated yet only count the messages in samuraiChatMessages
+    message_count = {"$subtract": [{"$ifNull": ["$message_count", 0]}, deleted]}
     samuraiChatHistory.update_one(
         filter={"samurai_id": samurai_id, "chat_id": chat_id},
-        update={
-            "$pull": {"messages": {"message_id": {"$in": [message_id, message_id - 1]}}}
-        },
+        update=[
+            {
+                "$set": {
+                    "last_message_id": message_id - 2,
+                    "message_count": {"$max": [message_count, 0]},
+                }
+            }
+        ],
     )
 
 
@@ -385,6 +416,12 @@ def insert_message(
             transcript = audio_text[i]
         else:
             transcript = None
+        if message_type == "image":
+            token_count = 0
+        elif "token_count" in message:
+            token_count = message["token_count"]
+        else:
+            token_count = count_tokens(transcript or message["content"])
         message_id += 1
         data = {
             "message_id": message_id,
@@ -392,14 +429,20 @@ def insert_message(
             "message_type": message_type,
             "message_content": message["content"],
             "message_audio_text": transcript,
+            "token_count": token_count,
             "reaction": None,
             "created_at": get_time(),
             "updated_at": get_time(),
         }
         new_messages.append(data)
+    message_store.insert_messages(samurai_id, chat_id, new_messages)
     update_query = {
-        "$push": {"messages": {"$each": new_messages}},
-        "$set": {"updated_at": get_time()},
+        "$set": {
+            "updated_at": get_time(),
+            "last_message_id": message_id,
+            "last_message": message_store.get_message_preview(new_messages[-1]),
+        },
+        "$inc": {"message_count": len(new_messages)},
     }
     if chat_title is not None:
         update_query["$set"]["chat_title"] = chat_title
@@ -414,63 +457,68 @@ def insert_message(
     status_code=status.HTTP_201_CREATED,
     summary="Response for question as audio file",
 )
-def gpt_audio_answer(
+async def gpt_audio_answer(
+    response: Response,
     chat_id: str = Form(...),
     file: UploadFile = File(...),
     current_user=Depends(get_user),
 ):
-    db_user = samuraiUser.find_one(filter={"samurai_id": current_user["samurai_id"]})
-    check_all_queries_used(db_user)
-
-    if not file.filename.endswith(("mp3", "m4a")):
-        invalid_file_format_error()
-    with open(file.filename, "wb+") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    with io.open(file.filename, "rb") as audio_file:
-        content = audio_file.read()
-    link_question = upload_file("audio", file.filename)
-    speech_to_text_response = speech_to_text(content)
-
-    if speech_to_text_response.results == []:
-        audio_not_clear_error()
-    question = speech_to_text_response.results[0].alternatives[0].transcript
-    language = speech_to_text_response.results[0].language_code
-    old_messages: list = get_chat_by_id(current_user["samurai_id"], chat_id)["messages"]
-    new_messages = [{"role": "user", "content": question}]
-    if old_messages != []:
-        messages_for_openai, message_id = process_old_messages(old_messages)
-        messages_for_openai.append(new_messages[-1])
-    else:
-        messages_for_openai, message_id = [{"role": "user", "content": question}], 0
-
-    complete_answer = openai.ChatCompletion.create(
-        model=settings["GPT_MODEL"], messages=messages_for_openai
+    samurai_id = current_user["samurai_id"]
+    timings = StageTimer()
+    question, language, complete_chat, upload_question = await load_audio_question(
+        samurai_id, chat_id, file, timings
     )
-    answer = complete_answer["choices"][0]["message"]["content"]
-    text_to_speech_response = text_to_speech(answer, language)
-    with open("converted_speech.mp3", "wb") as out:
-        out.write(text_to_speech_response.audio_content)
-    link_answer = upload_file("audio", "converted_speech.mp3")
-    new_messages.append({"role": "assistant", "content": link_answer})
-    audio_text = [question, answer]
-    new_messages[0]["content"] = link_question
-    if message_id == 0:
-        current_titles = get_all_current_titles(current_user["samurai_id"])
-        chat_title = title_generator(answer, current_titles)
-    else:
-        chat_title = None
-    insert_message(
-        current_user["samurai_id"],
-        chat_id,
-        new_messages,
-        message_id,
-        "audio",
-        audio_text,
-        chat_title=chat_title,
-    )
-    os.remove(file.filename)
-    os.remove("converted_speech.mp3")
+    try:
+        old_messages: list = complete_chat["messages"]
+        message_id = complete_chat["last_message_id"]
+        new_messages = [{"role": "user", "content": question}]
+        if old_messages != []:
+            messages_for_openai = process_old_messages(old_messages)
+            messages_for_openai.append(new_messages[-1])
+        else:
+            messages_for_openai = [{"role": "user", "content": question}]
+
+        complete_answer = await timings.run(
+            "completion", upstream.achat_completion(messages_for_openai)
+        )
+        answer = complete_answer["choices"][0]["message"]["content"]
+        text_to_speech_response = await timings.run(
+            "text_to_speech", run_in_threadpool(text_to_speech, answer, language)
+        )
+        link_question, link_answer = await asyncio.gather(
+            upload_question,
+            timings.run(
+                "upload_answer",
+                run_in_threadpool(
+                    media_store.put,
+                    "audio",
+                    "converted_speech.mp3",
+                    text_to_speech_response.audio_content,
+                ),
+            ),
+        )
+        new_messages.append({"role": "assistant", "content": link_answer})
+        audio_text = [question, answer]
+        new_messages[0]["content"] = link_question
+        chat_title = provisional_title(question) if message_id == 0 else None
+        await timings.run(
+            "save",
+            run_in_threadpool(
+                insert_message,
+                samurai_id,
+                chat_id,
+                new_messages,
+                message_id,
+                "audio",
+                audio_text,
+                chat_title=chat_title,
+            ),
+        )
+        if chat_title is not None:
+            title_jobs.submit(samurai_id, chat_id, answer, chat_title)
+    finally:
+        abandon_task(upload_question)
+    response.headers["Server-Timing"] = timings.server_timing()
     return {
         "status_code": status.HTTP_201_CREATED,
         "response_type": "SUCCESS",
@@ -484,6 +532,122 @@ def gpt_audio_answer(
     }
 
 
+@router.post(
+    path="/chat/audio/voice/",
+    status_code=status.HTTP_201_CREATED,
+    summary="Spoken answer for an audio question, streamed sentence by sentence",
+)
+async def gpt_audio_answer_voice_stream(
+    request: Request,
+    chat_id: str = Form(...),
+    file: UploadFile = File(...),
+    current_user=Depends(get_user),
+):
+    samurai_id = current_user["samurai_id"]
+    question, language, complete_chat, upload_question = await load_audio_question(
+        samurai_id, chat_id, file, StageTimer()
+    )
+    old_messages: list = complete_chat["messages"]
+    message_id = complete_chat["last_message_id"]
+    new_messages = [{"role": "user", "content": question}]
+    if old_messages != []:
+        messages_for_openai = process_old_messages(old_messages)
+        messages_for_openai.append(new_messages[-1])
+    else:
+        messages_for_openai = [{"role": "user", "content": question}]
+
+    async def voice_streamer():
+        audio_chunks = []
+
+        def audio_events(results):
+            for sentence, audio in results:
+                yield sse_event(
+                    "audio",
+                    {
+                        "index": len(audio_chunks),
+                        "text": sentence,
+                        "audio": base64.b64encode(audio).decode(),
+                    },
+                )
+                audio_chunks.append(audio)
+
+        try:
+            yield sse_event(
+                "metadata", {"message_id": message_id + 2, "chat_id": chat_id}
+            )
+            streaming_answer = await upstream.achat_completion(
+                messages_for_openai, stream=True
+            )
+            speech = speech_synthesizer.queue(language)
+            splitter = SentenceSplitter()
+            collector = StreamCollector()
+            try:
+                async for chunk in streaming_answer:
+                    word = collector.add_chunk(chunk)
+                    if word is None:
+                        continue
+                    for sentence in splitter.add(word):
+                        await speech.put(sentence)
+                    ready = speech.ready()
+                    if ready:
+                        for event in audio_events(ready):
+                            yield event
+                        if await request.is_disconnected():
+                            return
+                rest = splitter.flush()
+                if rest is not None:
+                    await speech.put(rest)
+                for event in audio_events(await speech.drain()):
+                    yield event
+            finally:
+                speech.cancel()
+                await close_stream(streaming_answer)
+
+            link_question, link_answer = await asyncio.gather(
+                upload_question,
+                run_in_threadpool(
+                    media_store.put,
+                    "audio",
+                    "converted_speech.mp3",
+                    b"".join(audio_chunks),
+                ),
+            )
+            new_messages[0]["content"] = link_question
+            new_messages.append({"role": "assistant", "content": link_answer})
+            chat_title = provisional_title(question) if message_id == 0 else None
+            await run_in_threadpool(
+                insert_message,
+                samurai_id,
+                chat_id,
+                new_messages,
+                message_id,
+                "audio",
+                [question, collector.answer],
+                chat_title=chat_title,
+            )
+            if chat_title is not None:
+                title_jobs.submit(samurai_id, chat_id, collector.answer, chat_title)
+            yield sse_event(
+                "done",
+                {
+                    "message_id": message_id + 2,
+                    "chat_id": chat_id,
+                    "question": link_question,
+                    "question_text": question,
+                    "answer": link_answer,
+                    "answer_text": collector.answer,
+                },
+            )
+        finally:
+            abandon_task(upload_question)
+
+    return StreamingResponse(
+        content=voice_streamer(),
+        status_code=status.HTTP_200_OK,
+        media_type="text/event-stream",
+    )
+
+
 @router.post(
     path="/chat/audio/text/",
     status_code=status.HTTP_201_CREATED,
@@ -494,24 +658,22 @@ def gpt_audio_answer_stream(
     file: UploadFile = File(...),
     current_user=Depends(get_user),
 ):
-    db_user = samuraiUser.find_one(filter={"samurai_id": current_user["samurai_id"]})
-    check_all_queries_used(db_user)
+    query_quota.consume(current_user["samurai_id"])
 
     if not file.filename.endswith(("mp3", "m4a")):
         invalid_file_format_error()
-    with open(file.filename, "wb+") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    link_question = upload_file("audio", file.filename)
-    old_messages: list = get_chat_by_id(current_user["samurai_id"], chat_id)["messages"]
-    audio_file = open(file.filename, "rb+")
-    question = audio_translate(audio_file)["text"]
+    with AudioIngest.read(file) as audio:
+        link_question = audio.upload("audio")
+        question = audio_translate(audio.as_file())["text"]
+    complete_chat = get_chat_tail(current_user["samurai_id"], chat_id)
+    old_messages: list = complete_chat["messages"]
+    message_id = complete_chat["last_message_id"]
     new_messages = [{"role": "user", "content": question}]
-    os.remove(file.filename)
     if old_messages != []:
-        messages_for_openai, message_id = process_old_messages(old_messages)
+        messages_for_openai = process_old_messages(old_messages)
         messages_for_openai.append(new_messages[-1])
     else:
-        messages_for_openai, message_id = new_messages, 0
+        messages_for_openai = new_messages
     audio_text = [question]
     new_messages[0]["content"] = link_question
 
@@ -526,24 +688,21 @@ def gpt_audio_answer_stream(
     messages_for_openai[-1]["content"] = question
 
     def msg_streamer(message):
-        streaming_answer = openai.ChatCompletion.create(
-            model=settings["GPT_MODEL"], messages=message, stream=True
-        )
-        complete_answer = ""
+        streaming_answer = upstream.chat_completion(message, stream=True)
+        collector = StreamCollector()
         for chunk in streaming_answer:
-            if "role" in chunk["choices"][0]["delta"]:
-                continue
-            if "content" in chunk["choices"][0]["delta"]:
-                word = chunk["choices"][0]["delta"]["content"]
-                complete_answer += word
+            word = collector.add_chunk(chunk)
+            if word is not None:
                 yield word
-        new_messages.append({"role": "assistant", "content": complete_answer})
+        new_messages.append(
+            {
+                "role": "assistant",
+                "content": collector.answer,
+                "token_count": collector.token_count,
+            }
+        )
         new_messages.pop(0)
-        if message_id == 0:
-            current_titles = get_all_current_titles(current_user["samurai_id"])
-            chat_title = title_generator(complete_answer, current_titles)
-        else:
-            chat_title = None
+        chat_title = provisional_title(question) if message_id == 0 else None
         insert_message(
             current_user["samurai_id"],
             chat_id,
@@ -552,6 +711,10 @@ def gpt_audio_answer_stream(
             "text",
             chat_title=chat_title,
         )
+        if chat_title is not None:
+            title_jobs.submit(
+                current_user["samurai_id"], chat_id, collector.answer, chat_title
+            )
 
     return StreamingResponse(
         content=msg_streamer(messages_for_openai),
@@ -566,24 +729,21 @@ def gpt_audio_answer_stream(
     summary="Response for image",
 )
 async def image_generation(payload: QuestionSchema, current_user=Depends(get_user)):
-    db_user = samuraiUser.find_one(filter={"samurai_id": current_user["samurai_id"]})
-    check_all_queries_used(db_user)
     chat_id: str = payload.chat_id
     question = payload.question
-    old_messages: list = get_chat_by_id(current_user["samurai_id"], chat_id)["messages"]
+    complete_chat = await load_question_context(current_user["samurai_id"], chat_id)
+    old_messages: list = complete_chat["messages"]
+    message_id = complete_chat["last_message_id"]
     new_messages = [{"role": "user", "content": question}]
 
     if old_messages != []:
-        messages_for_openai, message_id = process_old_messages(old_messages)
+        messages_for_openai = process_old_messages(old_messages)
         messages_for_openai.append(new_messages[-1])
     else:
-        messages_for_openai, message_id = [{"role": "user", "content": question}], 0
-    if message_id == 0:
-        current_titles = get_all_current_titles(current_user["samurai_id"])
-        chat_title = title_generator(question, current_titles)
-    else:
-        chat_title = None
-    insert_message(
+        messages_for_openai = [{"role": "user", "content": question}]
+    chat_title = provisional_title(question) if message_id == 0 else None
+    await run_in_threadpool(
+        insert_message,
         current_user["samurai_id"],
         chat_id,
         new_messages,
@@ -591,27 +751,42 @@ async def image_generation(payload: QuestionSchema, current_user=Depends(get_use
         "text",
         chat_title=chat_title,
     )
-    image = image_gen_model(question)
-    generated_image = Image.open(io.BytesIO(image.content))
-    generated_image.save("output.jpeg", "JPEG")
-    link = upload_file("images", "output.jpeg")
+    if chat_title is not None:
+        title_jobs.submit(current_user["samurai_id"], chat_id, question, chat_title)
+    image = await run_in_threadpool(image_gen_model, question)
+    images = await image_pipeline.transcode(image.content)
+    links = await asyncio.gather(
+        *(
+            run_in_threadpool(
+                upload_bytes,
+                "images",
+                "output.jpeg" if name == "original" else f"output_{name}.{extension}",
+                content,
+            )
+            for name, (extension, content) in images.items()
+        )
+    )
+    link, *variant_links = links
     new_messages.append({"role": "assistant", "content": link})
 
     new_messages.pop(0)
-    insert_message(
+    await run_in_threadpool(
+        insert_message,
         current_user["samurai_id"],
         chat_id,
         new_messages,
-        message_id,
+        message_id + 1,
         "image",
-        chat_title=chat_title,
     )
-    os.remove("output.jpeg")
     return {
         "status_code": status.HTTP_201_CREATED,
         "response_type": "SUCCESS",
         "description": "Image Generated",
-        "data": {"question": question, "link": link},
+        "data": {
+            "question": question,
+            "link": link,
+            "variants": dict(zip(list(images)[1:], variant_links)),
+        },
     }
 
 
@@ -620,7 +795,7 @@ async def image_generation(payload: QuestionSchema, current_user=Depends(get_use
     status_code=status.HTTP_201_CREATED,
     summary="Creating a talk video",
 )
-async def talk_generation(
+def talk_generation(
     file: UploadFile = File(...),
     script: str = Form(...),
     language: str = Form("english"),
@@ -628,8 +803,6 @@ async def talk_generation(
     style: str = Form(None),
     current_user=Depends(get_user),
 ):
-    db_user = samuraiUser.find_one(filter={"samurai_id": current_user["samurai_id"]})
-
     # process chat_id later
     # chat_id = payload.chat_id
     # file = payload.file
@@ -661,21 +834,18 @@ async def talk_generation(
     }
     model = voice_models[f"{language.lower()}_{gender.lower()}"]
 
-    with open(file.filename, "wb+") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    image_link = upload_file("images", file.filename)
-    response = generate_talk(image_link, script, model)
-    if response["result"] == "error":
-        video_generation_error(response["data"])
-
-    response = requests.get(response["result"])
-    with open("downloaded_video.mp4", "wb") as f:
-        f.write(response.content)
-
-    video_link = upload_file("video", "downloaded_video.mp4")
+    with MediaWorkspace() as workspace:
+        image_link = media_store.put("images", file.filename, file.file)
+        response = generate_talk(image_link, script, model)
+        if response["result"] == "error":
+            video_generation_error(response["data"])
 
-    os.remove(file.filename)
-    os.remove("downloaded_video.mp4")
+        with upstream.get(response["result"], stream=True) as response:
+            response.raw.decode_content = True
+            video_path = workspace.write(
+                "downloaded_video.mp4", response.raw, too_large=video_too_large_error
+            )
+        video_link = upload_file("video", video_path)
 
     return {
         "status_code": status.HTTP_201_CREATED,
@@ -685,33 +855,225 @@ async def talk_generation(
     }
 
 
-def check_all_queries_used(db_user):
-    if db_user["subscription"]["active"] is False:
-        if db_user["subscription"]["free_queries"] == 0:
-            all_free_queries_used_error()
-        samuraiUser.update_one(
-            filter={"samurai_id": db_user["samurai_id"]},
-            update={"$inc": {"subscription.free_queries": -1}},
+async def load_question_context(samurai_id, chat_id):
+    """
+    Takes a query from the user's quota and reads the chat tail
+    concurrently, returns the chat
+    """
+    _, chat = await asyncio.gather(
+        run_in_threadpool(query_quota.consume, samurai_id),
+        run_in_threadpool(get_chat_tail, samurai_id, chat_id),
+    )
+    return chat
+
+
+async def load_audio_question(samurai_id, chat_id, file, timings):
+    """
+    Transcribes an audio question while its upload and the chat tail
+    are fetched, returns the question, its language, the chat tail and
+    the pending upload of the question audio
+    """
+    if not file.filename.endswith(("mp3", "m4a")):
+        invalid_file_format_error()
+    consumed, audio = await asyncio.gather(
+        timings.run("quota", run_in_threadpool(query_quota.consume, samurai_id)),
+        timings.run("read", run_in_threadpool(AudioIngest.read, file)),
+        return_exceptions=True,
+    )
+    if isinstance(audio, AudioIngest):
+        with audio:
+            content = audio.content
+    for result in (consumed, audio):
+        if isinstance(result, BaseException):
+            raise result
+
+    # the question upload only has to finish before the messages are saved
+    upload_question = asyncio.ensure_future(
+        timings.run(
+            "upload_question",
+            run_in_threadpool(media_store.put, "audio", audio.filename, content),
+        )
+    )
+    try:
+        speech_to_text_response, complete_chat = await asyncio.gather(
+            timings.run("speech_to_text", run_in_threadpool(speech_to_text, content)),
+            timings.run(
+                "history", run_in_threadpool(get_chat_tail, samurai_id, chat_id)
+            ),
         )
+        if speech_to_text_response.results == []:
+            audio_not_clear_error()
+    except BaseException:
+        abandon_task(upload_question)
+        raise
+    result = speech_to_text_response.results[0]
+    return (
+        result.alternatives[0].transcript,
+        result.language_code,
+        complete_chat,
+        upload_question,
+    )
+
+
+def abandon_task(task):
+    """
+    Cancels a task whose result is no longer needed, an error it already
+    raised is retrieved so it is not logged as unhandled
+    """
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
+
+def encode_cursor(chat):
+    cursor = json.dumps([chat["updated_at"].isoformat(), chat["chat_id"]])
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        updated_at, chat_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(updated_at), chat_id
+    except (ValueError, TypeError):
+        invalid_cursor_error()
 
 
 def get_complete_chat_history(samurai_id):
-    cursor = samuraiChatHistory.find({"samurai_id": samurai_id}).sort(
-        key_or_list="updated_at", direction=-1
+    pipeline = [
+        {"$match": {"samurai_id": samurai_id}},
+        {"$sort": {"updated_at": -1}},
+        {
+            "$lookup": {
+                "from": message_store.samuraiChatMessages.name,
+                "let": {"chat_id": "$chat_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$chat_id", "$$chat_id"]}}},
+                    {"$sort": {"message_id": 1}},
+                    {"$project": message_store.MESSAGE_PROJECTION},
+                ],
+                "as": "stored_messages",
+            }
+        },
+        # chats not migrated yet still have their older messages in an array
+        {
+            "$set": {
+                "messages": {
+                    "$concatArrays": [{"$ifNull": ["$messages", []]}, "$stored_messages"]
+                }
+            }
+        },
+        {"$unset": "stored_messages"},
+    ]
+    return list(samuraiChatHistory.aggregate(pipeline))
+
+
+def get_chat_list(samurai_id, limit, cursor=None, preview=False):
+    """
+    One page of a user's chats, newest first, without messages.
+    Pages are keyed on (updated_at, chat_id) of the last chat returned.
+    """
+    query = {"samurai_id": samurai_id}
+    if cursor is not None:
+        updated_at, chat_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"updated_at": {"$lt": updated_at}},
+            {"updated_at": updated_at, "chat_id": {"$lt": chat_id}},
+        ]
+    projection = {
+        "_id": 0,
+        "chat_id": 1,
+        "chat_title": 1,
+        "chat_category_id": 1,
+        "chat_sub_category_id": 1,
+        "message_count": 1,
+        "created_at": 1,
+        "updated_at": 1,
+    }
+    if preview:
+        projection["last_message"] = 1
+    chats = list(
+        samuraiChatHistory.find(query, projection=projection)
+        .sort([("updated_at", -1), ("chat_id", -1)])
+        .limit(limit + 1)
     )
-    doc: str = dumps(cursor, indent=4)
-    return doc
+    next_cursor = encode_cursor(chats[limit - 1]) if len(chats) > limit else None
+    return chats[:limit], next_cursor
 
 
 def get_chat_by_id(samurai_id, chat_id):
-    db_user = samuraiChatHistory.find_one(
-        {"samurai_id": samurai_id, "chat_id": chat_id}
-    )
+    db_user = samuraiChatHistory.find_one({"samurai_id": samurai_id, "chat_id": chat_id})
     if db_user is None:
         chat_id_not_found_error()
     return db_user
 
 
+def get_chat_tail(samurai_id, chat_id, limit=None):
+    """
+    Chat details with only the last `limit` messages, read in one
+    aggregation so long chats are not loaded in full to answer a question
+    """
+    if limit is None:
+        limit = int(settings.get("CONTEXT_MAX_MESSAGES", 50))
+    legacy_messages = {"$ifNull": ["$messages", []]}
+    pipeline = [
+        {"$match": {"samurai_id": samurai_id, "chat_id": chat_id}},
+        {"$limit": 1},
+        # chats not migrated yet still have their older messages in an array,
+        # the migration numbers them on from the first one
+        {
+            "$set": {
+                "legacy_messages": {"$slice": [legacy_messages, -limit]},
+                "legacy_last_id": {
+                    "$add": [
+                        {"$ifNull": [{"$arrayElemAt": ["$messages.message_id", 0]}, 0]},
+                        {"$size": legacy_messages},
+                        -1,
+                    ]
+                },
+            }
+        },
+        {
+            "$lookup": {
+                "from": message_store.samuraiChatMessages.name,
+                "let": {"chat_id": "$chat_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$chat_id", "$$chat_id"]}}},
+                    {"$sort": {"message_id": -1}},
+                    {"$limit": limit},
+                    {"$project": message_store.MESSAGE_PROJECTION},
+                ],
+                "as": "messages",
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "chat_id": 1,
+                "chat_title": 1,
+                "chat_prompt": 1,
+                "last_message_id": 1,
+                "message_count": 1,
+                "messages": 1,
+                "legacy_messages": 1,
+                "legacy_last_id": 1,
+            }
+        },
+    ]
+    chat = next(samuraiChatHistory.aggregate(pipeline), None)
+    if chat is None:
+        chat_id_not_found_error()
+    chat["messages"].reverse()
+    legacy_messages = chat.pop("legacy_messages")
+    legacy_last_id = chat.pop("legacy_last_id")
+    chat["messages"] = (legacy_messages + chat["messages"])[-limit:]
+    if chat.get("last_message_id") is None:
+        chat["last_message_id"] = max(
+            [0, legacy_last_id, *(message["message_id"] for message in chat["messages"])]
+        )
+    return chat
+
+
 def ogg_to_mp3(ogg_path, mp3_path):
     ogg_audio = AudioSegment.from_file(ogg_path)
     ogg_audio.export(mp3_path, format="mp3")
@@ -720,17 +1082,30 @@ def ogg_to_mp3(ogg_path, mp3_path):
 def get_all_live_prompts():
     pipeline = [
         {"$match": {"chat_category_id": {"$exists": True, "$ne": None}}},
-        {"$unwind": "$messages"},
-        {"$match": {"messages.message_role": "user"}},
-        {"$sort": {"messages.updated_at": -1}},
         {
-            "$group": {
-                "_id": "$_id",
-                "lastUserMessage": {"$first": "$messages.message_content"},
-                "timestamp": {"$first": "$messages.updated_at"},
+            "$lookup": {
+                "from": message_store.samuraiChatMessages.name,
+                "let": {"chat_id": "$chat_id"},
+                "pipeline": [
+                    {
+                        "$match": {
+                            "$expr": {"$eq": ["$chat_id", "$$chat_id"]},
+                            "message_role": "user",
+                        }
+                    },
+                    {"$sort": {"updated_at": -1}},
+                    {"$limit": 1},
+                ],
+                "as": "lastUserMessage",
+            }
+        },
+        {"$unwind": "$lastUserMessage"},
+        {
+            "$project": {
+                "lastUserMessage": "$lastUserMessage.message_content",
+                "timestamp": "$lastUserMessage.updated_at",
             }
         },
-        {"$project": {"lastUserMessage": 1, "timestamp": 1}},
         {"$sort": {"timestamp": -1}},
     ]
 
@@ -741,35 +1116,16 @@ def get_all_live_prompts():
 
 def get_most_liked_prompts():
     pipeline = [
-        {"$unwind": "$messages"},
-        {"$match": {"messages.is_liked": True, "messages.message_role": "user"}},
-        {"$sort": {"messages.updated_at": -1}},
-        {"$project": {"message_content": "$messages.message_content", "_id": 0}},
+        {"$match": {"is_liked": True, "message_role": "user"}},
+        {"$sort": {"updated_at": -1}},
+        {"$project": {"message_content": 1, "_id": 0}},
         {"$limit": 50},
     ]
-    return [msg["message_content"] for msg in samuraiChatHistory.aggregate(pipeline)]
+    return [
+        msg["message_content"]
+        for msg in message_store.samuraiChatMessages.aggregate(pipeline)
+    ]
 
 
 def process_old_messages(old_messages, chat_prompt=None):
-    messages_for_openai = []
-    if chat_prompt is not None:
-        messages_for_openai.append({"role": "system", "content": chat_prompt})
-
-    # GPT is asked to consider last 10 messages only
-    for message in old_messages:
-        if message["message_type"] == "image":
-            messages_for_openai.pop(-1)
-            continue
-        if message["message_type"] == "audio":
-            openai_message = {
-                "role": message["message_role"],
-                "content": message["message_audio_text"],
-            }
-        else:
-            openai_message = {
-                "role": message["message_role"],
-                "content": message["message_content"],
-            }
-        messages_for_openai.append(openai_message)
-    message_id = old_messages[-1]["message_id"]
-    return messages_for_openai, message_id
+    return build_context(old_messages=old_messages, chat_prompt=chat_prompt)
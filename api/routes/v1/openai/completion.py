@@ -1,11 +1,16 @@
 from urllib import response
 from fastapi import APIRouter, status, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from helper.utils import *
 import shutil
 from database.database import data
 from models.payload import Samurai
 from samurai.api.get_logger import logger
-from fastapi.responses import StreamingResponse, FileResponse
+from services.response_cache import response_cache
+from services.upstream import upstream
+from services.singleflight import completions, get_flight_key
+from services.image_pipeline import image_pipeline
+from fastapi.responses import StreamingResponse, FileResponse, Response
 from bson.objectid import ObjectId
 import os
 import io
@@ -14,6 +19,26 @@ import io
 router = APIRouter()
 
 
+def get_answer(namespace, prompt, messages):
+    answer = response_cache.get(namespace, prompt)
+    if answer is None:
+        val = upstream.chat_completion(messages)
+        answer = val["choices"][0]["message"]["content"]
+        response_cache.set(namespace, prompt, answer)
+    return answer
+
+
+async def get_shared_answer(namespace, prompt, messages):
+    """
+    Cached or fresh answer for messages, read off the event loop. Identical
+    requests in flight share one cache lookup and upstream call
+    """
+    return await completions.do(
+        get_flight_key(messages),
+        lambda: run_in_threadpool(get_answer, namespace, prompt, messages),
+    )
+
+
 @router.post("/question")
 async def gpt(obj: Samurai):
     """
@@ -21,22 +46,8 @@ async def gpt(obj: Samurai):
     """
     try:
         prompt = obj.question
-        answer = data.find_one(
-            {
-                "_id": ObjectId("645a15383bea252b4af1f9c9"),
-                f"{prompt}": {"$exists": True},
-            }
-        )
-        if answer is None:
-            messages = [{"role": "user", "content": prompt}]
-            val = chat_completion(messages)
-            answer = val["choices"][0]["message"]["content"]
-            data.update_one(
-                {"_id": ObjectId("645a15383bea252b4af1f9c9")},
-                {"$set": {prompt: answer}},
-            )
-        else:
-            answer = answer[prompt]
+        messages = [{"role": "user", "content": prompt}]
+        answer = await get_shared_answer("question", prompt, messages)
         response = {
             "status_code": status.HTTP_200_OK,
             "response_type": "SUCCESS",
@@ -63,14 +74,10 @@ async def gpt(obj: Samurai):
     """
     try:
         prompt = obj.question
-        try:
-            os.remove("output.jpeg")
-        except:
-            pass
-        image = image_gen_model(prompt)
-        generated_image = Image.open(BytesIO(image.content))
-        generated_image.save("output.jpeg", "JPEG")
-        response = FileResponse("output.jpeg")
+        image = await run_in_threadpool(image_gen_model, prompt)
+        images = await image_pipeline.transcode(image.content, variants=())
+        _, content = images["original"]
+        response = Response(content=content, media_type="image/jpeg")
         return response
 
     except Exception as e:
@@ -134,29 +141,15 @@ async def gpt(obj: Samurai):
     """
     try:
         prompt = obj.question
-        answer = data.find_one(
+        messages = [
+            {"role": "system", "content": "act as a prompt generator."},
             {
-                "_id": ObjectId("6464aa287269ddd982d95fab"),
-                f"{prompt}": {"$exists": True},
-            }
-        )
-        if answer is None:
-            messages = [
-                {"role": "system", "content": "act as a prompt generator."},
-                {
-                    "role": "assistant",
-                    "content": "Of course! I can help generate prompts for various creative endeavors or thought-provoking exercises. Let me know what specific type of prompts you're interested in, and I'll be glad to assist you.",
-                },
-                {"role": "user", "content": prompt},
-            ]
-            val = chat_completion(messages)
-            answer = val["choices"][0]["message"]["content"]
-            data.update_one(
-                {"_id": ObjectId("6464aa287269ddd982d95fab")},
-                {"$set": {prompt: answer}},
-            )
-        else:
-            answer = answer[prompt]
+                "role": "assistant",
+                "content": "Of course! I can help generate prompts for various creative endeavors or thought-provoking exercises. Let me know what specific type of prompts you're interested in, and I'll be glad to assist you.",
+            },
+            {"role": "user", "content": prompt},
+        ]
+        answer = await get_shared_answer("prompt-generator", prompt, messages)
         response = {
             "status_code": status.HTTP_200_OK,
             "response_type": "SUCCESS",
@@ -232,22 +225,8 @@ async def gpt(file: UploadFile = File(...)):
             audio_file = open(file.filename, "rb+")
             prompt = audio_translate(audio_file)["text"]
             os.remove(file.filename)
-            answer = data.find_one(
-                {
-                    "_id": ObjectId("645a15383bea252b4af1f9c9"),
-                    f"{prompt}": {"$exists": True},
-                }
-            )
-            if answer is None:
-                messages = [{"role": "user", "content": prompt}]
-                val = chat_completion(messages)
-                answer = val["choices"][0]["message"]["content"]
-                data.update_one(
-                    {"_id": ObjectId("645a15383bea252b4af1f9c9")},
-                    {"$set": {prompt: answer}},
-                )
-            else:
-                answer = answer[prompt]
+            messages = [{"role": "user", "content": prompt}]
+            answer = await get_shared_answer("question", prompt, messages)
             response = {
                 "status_code": status.HTTP_200_OK,
                 "response_type": "SUCCESS",
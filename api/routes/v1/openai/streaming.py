@@ -1,9 +1,13 @@
 from fastapi import APIRouter, status, UploadFile, File, HTTPException
+from fastapi.concurrency import iterate_in_threadpool
 from helper.utils import *
 import shutil
 from database.database import data
 from models.payload import Samurai
 from samurai.api.get_logger import logger
+from services.singleflight import get_flight_key
+from services.stream_broker import stream_broker
+from services.stream_collector import StreamCollector
 from fastapi.responses import StreamingResponse
 import os
 
@@ -11,6 +15,16 @@ import os
 router = APIRouter()
 
 
+async def collected(source, route):
+    """
+    Passes a stream through a collector and logs the size of the answer
+    """
+    collector = StreamCollector()
+    async for text in collector.collect(source):
+        yield text
+    logger.info(f"{route} streamed {collector.token_count} tokens")
+
+
 @router.post("/stream/answer-audio")
 async def gpt(file: UploadFile = File(...)):
     """
@@ -52,9 +66,13 @@ async def gpt(obj: Samurai):
     """
     try:
         prompt = obj.question
-
+        key = get_flight_key([{"role": "user", "content": prompt}])
         return StreamingResponse(
-            streamer(prompt),
+            stream_broker.subscribe(
+                f"question:{key}", lambda: collected(
+                    iterate_in_threadpool(streamer(prompt)), "/stream/question"
+                )
+            ),
             status_code=status.HTTP_200_OK,
             media_type="text/event-stream",
         )
@@ -76,8 +94,15 @@ async def gpt(obj: Samurai):
     try:
         prompt = obj.question
         message = [{"role": "user", "content": prompt}]
+        key = get_flight_key(message)
         return StreamingResponse(
-            streamer_buffer(message),
+            stream_broker.subscribe(
+                f"no-buffer:{key}",
+                lambda: collected(
+                    iterate_in_threadpool(streamer_buffer(message)),
+                    "/stream/no-buffer/question",
+                ),
+            ),
             status_code=status.HTTP_200_OK,
             media_type="text/event-stream",
         )
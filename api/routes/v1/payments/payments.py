@@ -1,7 +1,7 @@
-import json
 from fastapi import APIRouter, status, HTTPException, Depends
 from models.payload import PaymentIntent, PaymentIntentConfirmation, InAppPayment
 from security.authorization import get_user
+from utils.responses import BSONResponse
 from helper.utils import get_time
 from utils.utils import create_ephemeral_key, create_intent, extend_time
 from exceptions.exceptions import (
@@ -15,7 +15,6 @@ from exceptions.exceptions import (
     wrong_plan_error,
 )
 from bson.objectid import ObjectId
-from bson.json_util import dumps
 from database.database import (
     samuraiUser,
     samuraiSubscriptionPlans,
@@ -39,13 +38,15 @@ def subscriptions():
     plans = samuraiSubscriptionPlans.find_one(
         {"_id": ObjectId("64b8e01a33c769ea301d5311")}
     )
-    doc = dumps(plans, indent=4)
-    return {
-        "status_code": status.HTTP_200_OK,
-        "response_type": "SUCCESS",
-        "description": "Plan Details",
-        "data": json.loads(doc),
-    }
+    return BSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "status_code": status.HTTP_200_OK,
+            "response_type": "SUCCESS",
+            "description": "Plan Details",
+            "data": plans,
+        },
+    )
 
 
 @router.post(
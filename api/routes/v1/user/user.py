@@ -1,5 +1,3 @@
-import shutil
-import os
 from urllib import response
 from fastapi import APIRouter, status, Depends, Response
 from models.payload import UserSchema, CompleteUser
@@ -11,7 +9,7 @@ from exceptions.exceptions import (
 from helper.utils import get_time
 from database.database import samuraiUser
 from config.settings import settings
-from config.file_upload import upload_file
+from services.media_store import media_store
 
 router = APIRouter()
 
@@ -63,9 +61,11 @@ def complete_user_profile(
 
     if payload.account_type.lower() not in ["business", "team", "student"]:
         incorrect_business_error()
-    with open(payload.profile_picture.filename, "wb+") as buffer:
-        shutil.copyfileobj(payload.profile_picture.file, buffer)
-    image_link = upload_file("profile_pictures", payload.profile_picture.filename)
+    image_link = media_store.put(
+        "profile_pictures",
+        payload.profile_picture.filename,
+        payload.profile_picture.file,
+    )
     update_query["$set"] = {
         "profile_completed": True,
         "name": payload.name,
@@ -78,7 +78,6 @@ def complete_user_profile(
         filter={"samurai_id": current_user["samurai_id"]},
         update=update_query,
     )
-    os.remove(payload.profile_picture.filename)
     return {
         "status_code": status_code,
         "response_type": "SUCCESS",
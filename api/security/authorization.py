@@ -1,10 +1,27 @@
+import hashlib
 from fastapi import Security, status, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from utils.utils import decode_token
 from database.database import samuraiUserToken
+from config.settings import settings
+from services.cache import TTLCache
 
 bearer = HTTPBearer()
 
+# (samurai_id, token hash) of tokens recently found in samuraiUserToken
+token_cache = TTLCache(
+    maxsize=int(settings.get("TOKEN_CACHE_SIZE", 10000)),
+    ttl=int(settings.get("TOKEN_CACHE_TTL", 60)),
+)
+
+
+def invalidate_token_cache(samurai_id):
+    """
+    Forget cached tokens of a user, call whenever samuraiUserToken changes
+    """
+    token_cache.discard_where(lambda key: key[0] == samurai_id)
+
 
 async def authorization(
     credentials: HTTPAuthorizationCredentials = Security(bearer),
@@ -20,8 +37,14 @@ async def authorization(
             headers={"WWW-Authenticate": "Bearer"},
         )
     token_data = decode_token(credentials.credentials)
-    token_in_database = samuraiUserToken.find_one(
-        filter={"samurai_id": token_data["samurai_id"]}
+    cache_key = (
+        token_data["samurai_id"],
+        hashlib.sha256(credentials.credentials.encode()).hexdigest(),
+    )
+    if token_cache.get(cache_key) is not None:
+        return token_data
+    token_in_database = await run_in_threadpool(
+        samuraiUserToken.find_one, filter={"samurai_id": token_data["samurai_id"]}
     )
     if token_in_database is None:
         raise HTTPException(
@@ -34,7 +57,7 @@ async def authorization(
     #         status_code=status.HTTP_401_UNAUTHORIZED,
     #         detail="Old Token",
     #     )
-
+    token_cache.set(cache_key, True)
     return token_data
 
 
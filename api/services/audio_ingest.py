@@ -0,0 +1,56 @@
+import io
+import os
+import tempfile
+from config.settings import settings
+from services.media_workspace import MEDIA_MAX_BYTES, copy_limited
+from services.media_store import media_store
+
+# uploads above this size are spooled to disk while they are read
+AUDIO_SPOOL_BYTES = int(settings.get("AUDIO_SPOOL_BYTES", 5 * 1024 * 1024))
+
+
+class AudioIngest:
+    """
+    An uploaded audio question, read from the request once and handed to
+    speech-to-text and to the uploader without touching the working dir
+    """
+
+    def __init__(self, filename, buffer):
+        self.filename = os.path.basename(filename)
+        self._buffer = buffer
+
+    @classmethod
+    def read(cls, file, spool_bytes=AUDIO_SPOOL_BYTES):
+        buffer = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        try:
+            copy_limited(file.file, buffer, MEDIA_MAX_BYTES)
+        except Exception:
+            buffer.close()
+            raise
+        return cls(file.filename, buffer)
+
+    @property
+    def content(self):
+        self._buffer.seek(0)
+        return self._buffer.read()
+
+    def as_file(self):
+        """
+        File object for APIs that detect the format from the file name
+        """
+        audio_file = io.BytesIO(self.content)
+        audio_file.name = self.filename
+        return audio_file
+
+    def upload(self, folder):
+        return media_store.put(folder, self.filename, self.content)
+
+    def close(self):
+        self._buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
@@ -0,0 +1,92 @@
+from functools import lru_cache
+from config.settings import settings
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# tokens OpenAI adds around every chat message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model=None):
+    """
+    Number of tokens in `text`, falls back to ~4 characters per token
+    when tiktoken is not installed
+    """
+    if not text:
+        return 0
+    encoding = get_encoding(model or settings["GPT_MODEL"])
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def get_context_content(message):
+    if message["message_type"] == "audio":
+        return message["message_audio_text"]
+    return message["message_content"]
+
+
+def get_token_count(message):
+    """
+    Token count stored with the message, computed for messages saved
+    before counts were cached
+    """
+    token_count = message.get("token_count")
+    if token_count is None:
+        token_count = count_tokens(get_context_content(message))
+    return token_count + MESSAGE_OVERHEAD_TOKENS
+
+
+def build_context(old_messages, chat_prompt=None, token_budget=None, min_messages=2):
+    """
+    Selects the most recent messages of a chat that fit in `token_budget`.
+    The chat prompt is always kept as the first message, image messages are
+    dropped along with the question that produced them, and the latest
+    `min_messages` messages are kept even if they go over the budget.
+
+    Returns messages in the format openai expects.
+    """
+    if token_budget is None:
+        token_budget = int(settings.get("CONTEXT_TOKEN_BUDGET", 3000))
+    remaining = token_budget
+    if chat_prompt is not None:
+        remaining -= count_tokens(chat_prompt) + MESSAGE_OVERHEAD_TOKENS
+
+    selected = []
+    skip_question = False
+    for message in reversed(old_messages):
+        if message["message_type"] == "image":
+            skip_question = True
+            continue
+        if skip_question:
+            skip_question = False
+            continue
+        token_count = get_token_count(message)
+        if token_count > remaining and len(selected) >= min_messages:
+            break
+        remaining -= token_count
+        selected.append(
+            {"role": message["message_role"], "content": get_context_content(message)}
+        )
+    # do not start the history with an answer whose question was cut off
+    if len(selected) > min_messages and selected[-1]["role"] == "assistant":
+        selected.pop(-1)
+
+    messages_for_openai = []
+    if chat_prompt is not None:
+        messages_for_openai.append({"role": "system", "content": chat_prompt})
+    messages_for_openai.extend(reversed(selected))
+    return messages_for_openai
@@ -0,0 +1,25 @@
+from io import BytesIO
+from PIL import Image
+
+# runs in the image worker processes, keep imports to PIL only
+FORMATS = {"jpeg": "JPEG", "webp": "WEBP", "png": "PNG"}
+
+
+def encode(image, extension):
+    buffer = BytesIO()
+    image.save(buffer, FORMATS[extension])
+    return buffer.getvalue()
+
+
+def transcode(content, variants):
+    """
+    Re-encodes image bytes to JPEG plus one scaled copy per variant,
+    returns {name: (extension, bytes)} with the full image as "original"
+    """
+    image = Image.open(BytesIO(content)).convert("RGB")
+    images = {"original": ("jpeg", encode(image, "jpeg"))}
+    for name, width, extension in variants:
+        variant = image.copy()
+        variant.thumbnail((width, width))
+        images[name] = (extension, encode(variant, extension))
+    return images
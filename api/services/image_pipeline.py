@@ -0,0 +1,68 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from config.settings import settings
+from services.image_codec import FORMATS, transcode
+
+
+def parse_variants(spec):
+    """
+    "thumb:256:jpeg,mobile:512:webp" -> (("thumb", 256, "jpeg"), ...),
+    raises ValueError for a malformed spec so it fails at startup
+    """
+    variants = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            name, width, extension = item.split(":")
+            width = int(width)
+        except ValueError:
+            raise ValueError(f"IMAGE_VARIANTS entry {item!r} is not name:width:format")
+        extension = extension.lower()
+        if extension not in FORMATS:
+            raise ValueError(
+                f"IMAGE_VARIANTS format {extension!r} is not one of {sorted(FORMATS)}"
+            )
+        if width <= 0 or name == "original":
+            raise ValueError(f"IMAGE_VARIANTS entry {item!r} is not allowed")
+        variants.append((name, width, extension))
+    return tuple(variants)
+
+
+class ImagePipeline:
+    """
+    Image decoding and encoding in a process pool, off the event loop
+    """
+
+    def __init__(self, workers, variants):
+        self.workers = workers
+        self.variants = variants
+        self._executor = None
+
+    @property
+    def executor(self):
+        # workers are spawned, forking the server would copy locks held by
+        # its threads (pymongo monitors, worker pools) into the children
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def transcode(self, content, variants=None):
+        if variants is None:
+            variants = self.variants
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, transcode, content, variants
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+image_pipeline = ImagePipeline(
+    workers=int(settings.get("IMAGE_WORKERS", 2)),
+    variants=parse_variants(settings.get("IMAGE_VARIANTS", "")),
+)
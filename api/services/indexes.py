@@ -0,0 +1,26 @@
+from pymongo import ASCENDING, DESCENDING
+from database.database import samuraiChatHistory
+from services import message_store
+from services.response_cache import response_cache
+
+
+def ensure_indexes():
+    """
+    Creates indexes used by the api, called once on startup
+    """
+    samuraiChatHistory.create_index(
+        [
+            ("samurai_id", ASCENDING),
+            ("updated_at", DESCENDING),
+            ("chat_id", DESCENDING),
+        ]
+    )
+    samuraiChatHistory.create_index(
+        [
+            ("samurai_id", ASCENDING),
+            ("chat_title", ASCENDING),
+            ("chat_id", ASCENDING),
+        ]
+    )
+    message_store.ensure_indexes()
+    response_cache.ensure_indexes()
@@ -0,0 +1,127 @@
+import hashlib
+import os
+from collections import Counter
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from config.settings import settings
+from database.database import data
+from services.cache import TTLCache
+from services.media_workspace import MEDIA_MAX_BYTES, copy_limited, upload_bytes
+
+samuraiMediaIndex = data.database["samuraiMediaIndex"]
+
+
+def get_content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def read_content(content):
+    """
+    Bytes of `content`, file objects are read up to MEDIA_MAX_BYTES
+    """
+    if isinstance(content, (bytes, bytearray)):
+        return bytes(content)
+    content.seek(0)
+    buffer = BytesIO()
+    copy_limited(content, buffer, MEDIA_MAX_BYTES)
+    return buffer.getvalue()
+
+
+class UploadBackend:
+    """
+    Stores media through config.file_upload
+    """
+
+    def put(self, folder, filename, content):
+        return upload_bytes(folder, filename, content)
+
+
+class FileSystemBackend:
+    """
+    Stores media under a local directory, a stand-in for the bucket in
+    tests and local runs
+    """
+
+    def __init__(self, root, base_url=None):
+        self.root = Path(root)
+        self.base_url = base_url
+
+    def put(self, folder, filename, content):
+        path = self.root / folder / filename
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        if self.base_url:
+            return f"{self.base_url.rstrip('/')}/{folder}/{filename}"
+        return path.resolve().as_uri()
+
+
+class MediaStore:
+    """
+    Content addressed uploads, media is stored once per folder under the
+    sha256 of its bytes and later uploads of the same bytes only look up
+    the stored link. Without an index collection links are only
+    remembered in memory.
+    """
+
+    def __init__(self, backend, collection=None, cache_size=4096, cache_ttl=3600):
+        self.backend = backend
+        self.collection = collection
+        self.metrics = Counter()
+        self._links = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def put(self, folder, filename, content):
+        """
+        Link to `content` (bytes or a file object), uploaded only if these
+        bytes were not stored in `folder` before
+        """
+        content = read_content(content)
+        digest = get_content_hash(content)
+        key = f"{folder}/{digest}"
+        link = self.get(key)
+        if link is not None:
+            self.metrics["deduplicated"] += 1
+            self.metrics["deduplicated_bytes"] += len(content)
+            return link
+
+        extension = os.path.splitext(filename)[1].lower()
+        link = self.backend.put(folder, f"{digest}{extension}", content)
+        self.metrics["uploaded"] += 1
+        self.metrics["uploaded_bytes"] += len(content)
+        if self.collection is not None:
+            self.collection.update_one(
+                filter={"_id": key},
+                update={
+                    "$setOnInsert": {
+                        "link": link,
+                        "size": len(content),
+                        "created_at": datetime.utcnow(),
+                    }
+                },
+                upsert=True,
+            )
+        self._links.set(key, link)
+        return link
+
+    def get(self, key):
+        link = self._links.get(key)
+        if link is None and self.collection is not None:
+            media = self.collection.find_one({"_id": key}, {"link": 1})
+            if media is not None:
+                link = media["link"]
+                self._links.set(key, link)
+        return link
+
+
+def get_media_store():
+    if settings.get("MEDIA_STORE_BACKEND", "upload") == "filesystem":
+        return MediaStore(
+            FileSystemBackend(
+                settings.get("MEDIA_STORE_ROOT", "media"),
+                settings.get("MEDIA_STORE_BASE_URL"),
+            )
+        )
+    return MediaStore(UploadBackend(), samuraiMediaIndex)
+
+
+media_store = get_media_store()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+from config.settings import settings
+from config.file_upload import upload_file
+from exceptions.exceptions import file_too_large_error
+
+CHUNK_SIZE = 1024 * 1024
+
+
+# the system temp dir unless set, tmpfs such as /dev/shm is opt-in since
+# containers often give it only 64 MB
+MEDIA_ROOT = settings.get("MEDIA_WORKSPACE_ROOT") or None
+MEDIA_MAX_BYTES = int(settings.get("MEDIA_MAX_BYTES", 50 * 1024 * 1024))
+
+
+def copy_limited(source, target, max_bytes, too_large=file_too_large_error):
+    """
+    Copies a file object, calls `too_large` once more than `max_bytes`
+    are read
+    """
+    size = 0
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            return size
+        size += len(chunk)
+        if size > max_bytes:
+            too_large()
+        target.write(chunk)
+
+
+class MediaWorkspace:
+    """
+    Private temp dir for the media files of one request, removed with
+    everything in it when the request is done
+    """
+
+    def __init__(self, max_bytes=MEDIA_MAX_BYTES, root=MEDIA_ROOT):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.path = tempfile.mkdtemp(prefix="samurai-media-", dir=root)
+
+    def file_path(self, name):
+        return os.path.join(self.path, os.path.basename(name))
+
+    def write(self, name, content, too_large=file_too_large_error):
+        """
+        Writes bytes or a file object, such as an upload or a streamed
+        download, to `name` and returns its path. Going over the size
+        limit calls `too_large`, by default a 413 for content sent by the
+        client.
+        """
+        path = self.file_path(name)
+        with open(path, "wb") as out:
+            if isinstance(content, (bytes, bytearray)):
+                if self.size + len(content) > self.max_bytes:
+                    too_large()
+                out.write(content)
+                self.size += len(content)
+            else:
+                if content.seekable():
+                    content.seek(0)
+                self.size += copy_limited(
+                    content, out, self.max_bytes - self.size, too_large
+                )
+        return path
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+
+def upload_bytes(folder, filename, content):
+    """
+    Uploads bytes or a file object under `filename`, through a workspace
+    since upload_file only takes paths
+    """
+    with MediaWorkspace() as workspace:
+        return upload_file(folder, workspace.write(filename, content))
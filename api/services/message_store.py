@@ -0,0 +1,224 @@
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from database.database import samuraiChatHistory
+from get_logger import logger
+
+# one document per message, keyed by (chat_id, message_id)
+samuraiChatMessages = samuraiChatHistory.database["samuraiChatMessages"]
+
+MESSAGE_PROJECTION = {"_id": 0, "samurai_id": 0, "chat_id": 0}
+
+
+def ensure_indexes():
+    samuraiChatMessages.create_index(
+        [("chat_id", ASCENDING), ("message_id", ASCENDING)], unique=True
+    )
+    samuraiChatMessages.create_index(
+        [("is_liked", ASCENDING), ("message_role", ASCENDING), ("updated_at", DESCENDING)]
+    )
+
+
+def get_message_preview(message, length=200):
+    """
+    Short copy of a message kept on the chat for chat listings
+    """
+    return {
+        "message_id": message["message_id"],
+        "message_role": message["message_role"],
+        "message_type": message["message_type"],
+        "message_content": message["message_content"][:length],
+    }
+
+
+def insert_messages(samurai_id, chat_id, messages):
+    samuraiChatMessages.insert_many(
+        [{"samurai_id": samurai_id, "chat_id": chat_id, **message} for message in messages]
+    )
+
+
+def get_all_messages(chat_id):
+    cursor = samuraiChatMessages.find(
+        {"chat_id": chat_id}, projection=MESSAGE_PROJECTION
+    ).sort("message_id", ASCENDING)
+    return list(cursor)
+
+
+def find_message(samurai_id, chat_id, message_id):
+    message = samuraiChatMessages.find_one(
+        {"samurai_id": samurai_id, "chat_id": chat_id, "message_id": message_id},
+        projection=MESSAGE_PROJECTION,
+    )
+    if message is None:
+        # chats not migrated yet still keep their messages in the chat document
+        chat = samuraiChatHistory.find_one(
+            {"samurai_id": samurai_id, "chat_id": chat_id, "messages.message_id": message_id},
+            projection={"_id": 0, "messages.$": 1},
+        )
+        message = chat["messages"][0] if chat else None
+    return message
+
+
+def update_message(samurai_id, chat_id, message_id, update):
+    result = samuraiChatMessages.update_one(
+        filter={"samurai_id": samurai_id, "chat_id": chat_id, "message_id": message_id},
+        update=update,
+    )
+    if result.matched_count == 0:
+        samuraiChatHistory.update_one(
+            filter={
+                "samurai_id": samurai_id,
+                "chat_id": chat_id,
+                "messages.message_id": message_id,
+            },
+            update={
+                operator: {f"messages.$.{field}": value for field, value in fields.items()}
+                for operator, fields in update.items()
+            },
+        )
+
+
+def delete_messages(chat_id, message_ids):
+    """
+    Returns number of messages deleted from samuraiChatMessages, messages
+    of a chat not migrated yet are taken out of its array as well
+    """
+    samuraiChatHistory.update_one(
+        filter={"chat_id": chat_id, "messages.message_id": {"$in": message_ids}},
+        update={"$pull": {"messages": {"message_id": {"$in": message_ids}}}},
+    )
+    result = samuraiChatMessages.delete_many(
+        {"chat_id": chat_id, "message_id": {"$in": message_ids}}
+    )
+    return result.deleted_count
+
+
+def delete_chat_messages(chat_id):
+    samuraiChatMessages.delete_many({"chat_id": chat_id})
+
+
+def renumber_duplicate_ids(messages):
+    """
+    Chats saved before messages had their own documents could hold an
+    image answer with the same message_id as its question. Messages of
+    such chats are numbered again in order, other chats keep their ids.
+    """
+    message_ids = [message["message_id"] for message in messages]
+    if len(set(message_ids)) == len(message_ids):
+        return messages
+    first_id = message_ids[0]
+    return [
+        {**message, "message_id": first_id + position}
+        for position, message in enumerate(messages)
+    ]
+
+
+def is_same_message(stored, message):
+    return stored is not None and (
+        stored.get("created_at") == message.get("created_at")
+        and stored.get("message_content") == message.get("message_content")
+    )
+
+
+def migrate_embedded_messages(batch_size=500):
+    """
+    Moves messages stored in the `messages` array of chat documents into
+    samuraiChatMessages. Meant to run after the deploy, the API reads the
+    arrays of chats not migrated yet and numbers new messages after them.
+
+    Can be run again, a message found in samuraiChatMessages counts as
+    copied only if it has the same created_at and content. A chat whose
+    ids are taken by other messages, or that changed while it was copied,
+    keeps its array and is logged.
+
+    Returns number of chats migrated.
+    """
+    migrated = 0
+    chats = samuraiChatHistory.find(
+        {"messages.0": {"$exists": True}},
+        projection={"samurai_id": 1, "chat_id": 1, "messages": 1},
+        batch_size=batch_size,
+    )
+    for chat in chats:
+        messages = renumber_duplicate_ids(chat["messages"])
+        operations = [
+            UpdateOne(
+                filter={"chat_id": chat["chat_id"], "message_id": message["message_id"]},
+                update={
+                    "$setOnInsert": {
+                        "samurai_id": chat["samurai_id"],
+                        "chat_id": chat["chat_id"],
+                        **message,
+                    }
+                },
+                upsert=True,
+            )
+            for message in messages
+        ]
+        result = samuraiChatMessages.bulk_write(operations, ordered=False)
+        existing = [
+            message
+            for position, message in enumerate(messages)
+            if position not in result.upserted_ids
+        ]
+        stored = {}
+        if existing:
+            cursor = samuraiChatMessages.find(
+                {
+                    "chat_id": chat["chat_id"],
+                    "message_id": {"$in": [message["message_id"] for message in existing]},
+                },
+                projection=MESSAGE_PROJECTION,
+            )
+            stored = {message["message_id"]: message for message in cursor}
+        conflicts = [
+            message["message_id"]
+            for message in existing
+            if not is_same_message(stored.get(message["message_id"]), message)
+        ]
+        if conflicts:
+            logger.error(
+                f"chat {chat['chat_id']} kept its messages, "
+                f"message ids {conflicts} are taken by other messages"
+            )
+            continue
+        last_message = messages[-1]
+        last_message_id = {"$ifNull": ["$last_message_id", 0]}
+        # messages saved since the deploy are already counted and come
+        # after the ones in the array
+        result = samuraiChatHistory.update_one(
+            filter={"_id": chat["_id"], "messages": chat["messages"]},
+            update=[
+                {
+                    "$set": {
+                        "last_message": {
+                            "$cond": [
+                                {"$gt": [last_message_id, last_message["message_id"]]},
+                                "$last_message",
+                                {"$literal": get_message_preview(last_message)},
+                            ]
+                        },
+                        "last_message_id": {
+                            "$max": [last_message_id, last_message["message_id"]]
+                        },
+                        "message_count": {
+                            "$add": [{"$ifNull": ["$message_count", 0]}, len(messages)]
+                        },
+                    }
+                },
+                {"$unset": "messages"},
+            ],
+        )
+        if result.modified_count == 0:
+            logger.error(
+                f"chat {chat['chat_id']} kept its messages, it changed while they were copied"
+            )
+            continue
+        migrated += 1
+    # chats that never got a message
+    samuraiChatHistory.update_many(
+        filter={"message_count": {"$exists": False}, "messages.0": {"$exists": False}},
+        update={
+            "$set": {"last_message_id": 0, "message_count": 0},
+            "$unset": {"messages": ""},
+        },
+    )
+    return migrated
@@ -0,0 +1,62 @@
+import json
+import threading
+from config.settings import settings
+from get_logger import logger
+from services.media_store import media_store
+from services.response_cache import response_cache
+from services.singleflight import completions
+from services.stream_broker import stream_broker
+from services.upstream import upstream
+from services.use_counts import use_counts
+
+
+def collect_metrics():
+    """
+    Counters of the shared services of this worker
+    """
+    return {
+        "upstream": {**upstream.snapshot(), "pools": upstream.pool_stats()},
+        "response_cache": {
+            **response_cache.metrics,
+            "hit_rate": response_cache.hit_rate(),
+        },
+        "completions": dict(completions.metrics),
+        "stream_broker": dict(stream_broker.metrics),
+        "use_counts": dict(use_counts.metrics),
+        "media_store": dict(media_store.metrics),
+    }
+
+
+class MetricsReporter:
+    """
+    Logs collect_metrics() every `interval` seconds, 0 turns it off
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                logger.info(f"metrics {json.dumps(collect_metrics())}")
+            except Exception as error:
+                logger.error(f"collecting metrics failed: {error}")
+
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+metrics_reporter = MetricsReporter(
+    interval=float(settings.get("METRICS_LOG_INTERVAL", 60))
+)
@@ -0,0 +1,105 @@
+import threading
+from pymongo import UpdateOne
+from config.settings import settings
+from database.database import samuraiUser
+from exceptions.exceptions import (
+    account_does_not_exist_error,
+    all_free_queries_used_error,
+)
+
+
+class QueryQuota:
+    """
+    Free query accounting for users without an active subscription.
+
+    Queries are taken from subscription.free_queries with one conditional
+    update, so parallel requests can never take the count below zero.
+    With `block_size` above 1 a worker reserves up to that many queries per
+    update and serves the next ones from memory, unused reservations are
+    given back by `release_all` on shutdown. Users with an active
+    subscription are not limited.
+    """
+
+    def __init__(self, block_size=1):
+        self.block_size = block_size
+        self._reserved = {}
+        self._lock = threading.Lock()
+
+    def _take_reserved(self, samurai_id):
+        with self._lock:
+            reserved = self._reserved.get(samurai_id, 0)
+            if reserved == 0:
+                return False
+            if reserved == 1:
+                del self._reserved[samurai_id]
+            else:
+                self._reserved[samurai_id] = reserved - 1
+            return True
+
+    def consume(self, samurai_id):
+        """
+        Takes one query from the user, raises if none are left
+        """
+        if self._take_reserved(samurai_id):
+            return
+        free_queries = "$subscription.free_queries"
+        db_user = samuraiUser.find_one_and_update(
+            filter={"samurai_id": samurai_id},
+            update=[
+                {
+                    "$set": {
+                        "subscription.free_queries": {
+                            "$cond": [
+                                {
+                                    "$and": [
+                                        {"$eq": ["$subscription.active", False]},
+                                        {"$gt": [free_queries, 0]},
+                                    ]
+                                },
+                                {
+                                    "$max": [
+                                        {"$subtract": [free_queries, self.block_size]},
+                                        0,
+                                    ]
+                                },
+                                free_queries,
+                            ]
+                        }
+                    }
+                }
+            ],
+            projection={"subscription": 1},
+        )
+        if db_user is None:
+            account_does_not_exist_error()
+        subscription = db_user["subscription"]
+        if subscription["active"] is not False:
+            return
+        if subscription["free_queries"] <= 0:
+            all_free_queries_used_error()
+        reserved = min(self.block_size, subscription["free_queries"]) - 1
+        if reserved > 0:
+            with self._lock:
+                reserved += self._reserved.get(samurai_id, 0)
+                self._reserved[samurai_id] = reserved
+
+    def release_all(self):
+        """
+        Gives queries reserved by this worker back to their users
+        """
+        with self._lock:
+            reserved, self._reserved = self._reserved, {}
+        if reserved:
+            samuraiUser.bulk_write(
+                [
+                    UpdateOne(
+                        filter={"samurai_id": samurai_id},
+                        update={"$inc": {"subscription.free_queries": count}},
+                    )
+                    for samurai_id, count in reserved.items()
+                ],
+                ordered=False,
+            )
+
+
+query_quota = QueryQuota(block_size=int(settings.get("QUOTA_RESERVATION_BLOCK", 1)))
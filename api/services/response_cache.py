@@ -0,0 +1,162 @@
+import hashlib
+import math
+import threading
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+from config.settings import settings
+from database.database import data
+from services.cache import TTLCache
+
+samuraiResponseCache = data.database["samuraiResponseCache"]
+
+EMBEDDING_DIMENSIONS = 512
+
+
+def normalize_prompt(prompt):
+    return " ".join(prompt.lower().split())
+
+
+def get_cache_key(namespace, prompt):
+    return hashlib.sha256(f"{namespace}\n{prompt}".encode()).hexdigest()
+
+
+def embed(prompt):
+    """
+    Unit vector of hashed character trigrams, cheap enough to compute per
+    request and close for prompts that differ by a few words or typos
+    """
+    padded = f"  {prompt} "
+    trigrams = Counter(
+        hash(padded[i : i + 3]) % EMBEDDING_DIMENSIONS for i in range(len(padded) - 2)
+    )
+    norm = math.sqrt(sum(count * count for count in trigrams.values()))
+    return {index: count / norm for index, count in trigrams.items()}
+
+
+def similarity(first, second):
+    if len(first) > len(second):
+        first, second = second, first
+    return sum(value * second.get(index, 0) for index, value in first.items())
+
+
+class ResponseCache:
+    """
+    Answers keyed on the hash of the normalized prompt, per namespace.
+
+    Lookups go through an in-process LRU, then samuraiResponseCache, whose
+    entries expire after `ttl` seconds and are trimmed to `max_entries`.
+    With `similarity_threshold` above 0, a prompt close enough to one of
+    the last `similarity_window` cached prompts reuses its answer.
+    """
+
+    def __init__(
+        self, ttl, max_entries, memory_size, similarity_threshold, similarity_window
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.metrics = Counter()
+        self._memory = TTLCache(maxsize=memory_size, ttl=ttl)
+        self._recent = deque(maxlen=similarity_window)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def ensure_indexes(self):
+        samuraiResponseCache.create_index("expires_at", expireAfterSeconds=0)
+        samuraiResponseCache.create_index([("created_at", ASCENDING)])
+
+    def get(self, namespace, prompt):
+        prompt = normalize_prompt(prompt)
+        key = get_cache_key(namespace, prompt)
+        answer = self._memory.get(key)
+        if answer is not None:
+            self.metrics["memory_hits"] += 1
+            return answer
+        cached = samuraiResponseCache.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.utcnow()}},
+            projection={"answer": 1},
+        )
+        if cached is not None:
+            self.metrics["database_hits"] += 1
+            self._memory.set(key, cached["answer"])
+            return cached["answer"]
+        if self.similarity_threshold > 0:
+            answer = self._get_similar(namespace, prompt)
+            if answer is not None:
+                self.metrics["similar_hits"] += 1
+                return answer
+        self.metrics["misses"] += 1
+        return None
+
+    def _get_similar(self, namespace, prompt):
+        vector = embed(prompt)
+        best_score, best_key = self.similarity_threshold, None
+        with self._lock:
+            recent = list(self._recent)
+        for entry_namespace, entry_key, entry_vector in recent:
+            if entry_namespace != namespace:
+                continue
+            score = similarity(vector, entry_vector)
+            if score >= best_score:
+                best_score, best_key = score, entry_key
+        if best_key is None:
+            return None
+        return self._memory.get(best_key)
+
+    def set(self, namespace, prompt, answer):
+        prompt = normalize_prompt(prompt)
+        key = get_cache_key(namespace, prompt)
+        self._memory.set(key, answer)
+        if self.similarity_threshold > 0:
+            with self._lock:
+                self._recent.append((namespace, key, embed(prompt)))
+        now = datetime.utcnow()
+        samuraiResponseCache.update_one(
+            filter={"_id": key},
+            update={
+                "$set": {
+                    "namespace": namespace,
+                    "prompt": prompt,
+                    "answer": answer,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=self.ttl),
+                }
+            },
+            upsert=True,
+        )
+        with self._lock:
+            self._writes += 1
+            trim = self._writes % 100 == 0
+        if trim:
+            self.trim()
+
+    def trim(self):
+        """
+        Deletes the oldest entries above `max_entries`
+        """
+        excess = samuraiResponseCache.estimated_document_count() - self.max_entries
+        if excess <= 0:
+            return
+        oldest = samuraiResponseCache.find(projection={"_id": 1}).sort(
+            "created_at", ASCENDING
+        )
+        samuraiResponseCache.delete_many(
+            {"_id": {"$in": [entry["_id"] for entry in oldest.limit(excess)]}}
+        )
+        self.metrics["evicted"] += excess
+
+    def hit_rate(self):
+        tiers = ("memory_hits", "database_hits", "similar_hits")
+        hits = sum(self.metrics[tier] for tier in tiers)
+        lookups = hits + self.metrics["misses"]
+        return hits / lookups if lookups else 0.0
+
+
+response_cache = ResponseCache(
+    ttl=int(settings.get("RESPONSE_CACHE_TTL", 7 * 24 * 3600)),
+    max_entries=int(settings.get("RESPONSE_CACHE_MAX_ENTRIES", 100000)),
+    memory_size=int(settings.get("RESPONSE_CACHE_MEMORY_SIZE", 1000)),
+    similarity_threshold=float(settings.get("RESPONSE_CACHE_SIMILARITY", 0)),
+    similarity_window=int(settings.get("RESPONSE_CACHE_SIMILARITY_WINDOW", 2000)),
+)
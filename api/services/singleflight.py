@@ -0,0 +1,40 @@
+import asyncio
+import hashlib
+import json
+from collections import Counter
+from services.response_cache import normalize_prompt
+
+
+def get_flight_key(messages):
+    normalized = [
+        {"role": message["role"], "content": normalize_prompt(message["content"])}
+        for message in messages
+    ]
+    return hashlib.sha256(json.dumps(normalized).encode()).hexdigest()
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time, concurrent callers with the same key
+    wait for the running call and share its result or error. The call runs
+    in its own task so a disconnecting caller does not cancel it for the
+    others.
+    """
+
+    def __init__(self):
+        self.metrics = Counter()
+        self._calls = {}
+
+    async def do(self, key, function):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.metrics["upstream_calls"] += 1
+        else:
+            self.metrics["saved_calls"] += 1
+        return await asyncio.shield(task)
+
+
+completions = SingleFlight()
@@ -0,0 +1,113 @@
+import asyncio
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import settings
+from config.google_cloud import text_to_speech
+
+SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s+|\n+")
+
+
+class SentenceSplitter:
+    """
+    Cuts streamed answer text into sentences, sentences shorter than
+    `min_chars` are joined with the next one
+    """
+
+    def __init__(self, min_chars=None):
+        if min_chars is None:
+            min_chars = int(settings.get("TTS_MIN_SENTENCE_CHARS", 20))
+        self.min_chars = min_chars
+        self._pending = ""
+        self._short = ""
+
+    def add(self, text):
+        """
+        Adds streamed text, returns the sentences it completed
+        """
+        self._pending += text
+        *complete, self._pending = SENTENCE_END.split(self._pending)
+        sentences = []
+        for sentence in complete:
+            self._short = f"{self._short} {sentence.strip()}".strip()
+            if len(self._short) >= self.min_chars:
+                sentences.append(self._short)
+                self._short = ""
+        return sentences
+
+    def flush(self):
+        rest = f"{self._short} {self._pending.strip()}".strip()
+        self._pending, self._short = "", ""
+        return rest or None
+
+
+def synthesize(text, language):
+    return text_to_speech(text, language).audio_content
+
+
+class SpeechQueue:
+    """
+    Sentences of one answer being synthesized, results come out in order
+    """
+
+    def __init__(self, executor, language, max_pending):
+        self.language = language
+        self.max_pending = max_pending
+        self._executor = executor
+        self._pending = deque()
+
+    async def put(self, text):
+        """
+        Queues a sentence, waits while `max_pending` are still synthesizing
+        """
+        if len(self._pending) >= self.max_pending:
+            await asyncio.wait({self._pending[0][1]})
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, synthesize, text, self.language
+        )
+        self._pending.append((text, future))
+
+    def ready(self):
+        """
+        (sentence, audio) pairs finished so far, without waiting
+        """
+        results = []
+        while self._pending and self._pending[0][1].done():
+            text, future = self._pending.popleft()
+            results.append((text, future.result()))
+        return results
+
+    async def drain(self):
+        results = []
+        while self._pending:
+            text, future = self._pending.popleft()
+            results.append((text, await future))
+        return results
+
+    def cancel(self):
+        while self._pending:
+            self._pending.popleft()[1].cancel()
+
+
+class SpeechSynthesizer:
+    """
+    Text-to-speech thread pool shared by all streamed voice answers
+    """
+
+    def __init__(self, workers, max_pending):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="speech"
+        )
+
+    def queue(self, language):
+        return SpeechQueue(self._executor, language, self.max_pending)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+speech_synthesizer = SpeechSynthesizer(
+    workers=int(settings.get("TTS_WORKERS", 4)),
+    max_pending=int(settings.get("TTS_MAX_PENDING", 3)),
+)
@@ -0,0 +1,59 @@
+import json
+import time
+import anyio
+from config.settings import settings
+
+
+def sse_event(event, data):
+    """
+    Server-sent event with a JSON payload
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class DeltaBuffer:
+    """
+    Groups answer tokens so each write carries `max_chars` characters or
+    `max_delay` seconds worth of tokens instead of a single token
+    """
+
+    def __init__(self, max_chars=None, max_delay=None):
+        if max_chars is None:
+            max_chars = int(settings.get("SSE_FLUSH_CHARS", 64))
+        if max_delay is None:
+            max_delay = float(settings.get("SSE_FLUSH_INTERVAL", 0.05))
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self._parts = []
+        self._size = 0
+        self._started_at = None
+
+    def add(self, text):
+        """
+        Buffers text, returns True when the buffer should be flushed
+        """
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        self._parts.append(text)
+        self._size += len(text)
+        return (
+            self._size >= self.max_chars
+            or time.monotonic() - self._started_at >= self.max_delay
+        )
+
+    def flush(self):
+        text = "".join(self._parts)
+        self._parts, self._size, self._started_at = [], 0, None
+        return text
+
+    def __bool__(self):
+        return self._size > 0
+
+
+async def close_stream(stream):
+    """
+    Closes an upstream stream even while the request is being cancelled,
+    so the connection is dropped and generation stops
+    """
+    with anyio.CancelScope(shield=True):
+        await stream.aclose()
@@ -0,0 +1,135 @@
+import asyncio
+from collections import Counter, deque
+from itertools import islice
+from config.settings import settings
+
+
+class StreamInterrupted(Exception):
+    """
+    Raised to a subscriber whose stream stopped before the answer was
+    complete, so the cut is not mistaken for a finished answer
+    """
+
+
+class BroadcastStream:
+    """
+    One upstream stream read once and replayed to every subscriber.
+
+    Chunks are kept in a buffer of at most `max_buffered` chunks so late
+    subscribers start from the first chunk. Once the buffer overflows the
+    stream stops accepting subscribers, and a subscriber that falls behind
+    the oldest buffered chunk gets StreamInterrupted instead of holding the
+    upstream back. An upstream error is raised to every subscriber once it
+    has read the chunks sent before it.
+    """
+
+    def __init__(self, max_buffered):
+        self.max_buffered = max_buffered
+        self.replayable = True
+        self.subscribers = 0
+        self._chunks = deque()
+        self._offset = 0
+        self._done = False
+        self._error = None
+        self._changed = asyncio.Condition()
+        self._task = None
+
+    @property
+    def finished(self):
+        return self._task is not None and self._task.done()
+
+    def start(self, source):
+        self._task = asyncio.ensure_future(self._pump(source))
+        return self._task
+
+    async def _pump(self, source):
+        try:
+            async for chunk in source:
+                async with self._changed:
+                    self._chunks.append(chunk)
+                    if len(self._chunks) > self.max_buffered:
+                        self._chunks.popleft()
+                        self._offset += 1
+                        self.replayable = False
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            self._error = StreamInterrupted("stream was cancelled")
+            raise
+        except Exception as error:
+            self._error = error
+        finally:
+            async with self._changed:
+                self._done = True
+                self._changed.notify_all()
+
+    def _available(self, position):
+        return self._done or position < self._offset + len(self._chunks)
+
+    def subscribe(self):
+        """
+        Registers a subscriber right away, so the upstream keeps running
+        for it even before it reads its first chunk
+        """
+        self.subscribers += 1
+        return self._read()
+
+    async def _read(self):
+        position = 0
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: self._available(position))
+                    if position < self._offset:
+                        raise StreamInterrupted(
+                            "subscriber fell behind the stream buffer"
+                        )
+                    chunks = list(islice(self._chunks, position - self._offset, None))
+                    done = self._done
+                for chunk in chunks:
+                    yield chunk
+                position += len(chunks)
+                if done and not chunks:
+                    if self._error is not None:
+                        error = StreamInterrupted("upstream stream failed")
+                        raise error from self._error
+                    return
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and self._task is not None:
+                self._task.cancel()
+
+
+class StreamBroker:
+    """
+    Shares running streams between requests for the same key
+    """
+
+    def __init__(self, max_buffered):
+        self.max_buffered = max_buffered
+        self.metrics = Counter()
+        self._streams = {}
+
+    def subscribe(self, key, open_source):
+        """
+        Async iterator over the stream for `key`, `open_source` is only
+        called when no replayable stream is running for it
+        """
+        stream = self._streams.get(key)
+        if stream is None or not stream.replayable or stream.finished:
+            stream = BroadcastStream(self.max_buffered)
+            self._streams[key] = stream
+            task = stream.start(open_source())
+            task.add_done_callback(lambda _: self._remove(key, stream))
+            self.metrics["upstream_streams"] += 1
+        else:
+            self.metrics["shared_subscriptions"] += 1
+        return stream.subscribe()
+
+    def _remove(self, key, stream):
+        if self._streams.get(key) is stream:
+            del self._streams[key]
+
+
+stream_broker = StreamBroker(
+    max_buffered=int(settings.get("STREAM_BROKER_MAX_CHUNKS", 4096))
+)
@@ -0,0 +1,48 @@
+class StreamCollector:
+    """
+    Accumulates a streamed answer as a list of parts, the answer is only
+    joined once when it is read
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._answer = None
+
+    def add(self, text):
+        self._parts.append(text)
+        self._answer = None
+        return text
+
+    def add_chunk(self, chunk):
+        """
+        Collects the content of an OpenAI stream chunk, returns it or None
+        when the chunk carries no content
+        """
+        delta = chunk["choices"][0]["delta"]
+        if "content" not in delta:
+            return None
+        text = delta["content"]
+        self._parts.append(text)
+        self._answer = None
+        return text
+
+    async def collect(self, source):
+        """
+        Passes an async stream of text chunks through while collecting it
+        """
+        async for text in source:
+            yield self.add(text)
+
+    @property
+    def answer(self):
+        if self._answer is None:
+            self._answer = "".join(self._parts)
+        return self._answer
+
+    @property
+    def token_count(self):
+        # every streamed delta is one completion token
+        return len(self._parts)
+
+    def __bool__(self):
+        return bool(self._parts)
@@ -0,0 +1,53 @@
+import threading
+import time
+from config.settings import settings
+from database.database import samuraiSystemPrompts
+
+
+class SystemPromptCatalogue:
+    """
+    In memory copy of samuraiSystemPrompts. Once loaded, reads never wait
+    on Mongo, a stale copy is served while a background thread reloads it.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._categories = []
+        self._prompts = {}
+        self._loaded_at = None
+        self._refreshing = threading.Lock()
+
+    def refresh(self):
+        categories = list(samuraiSystemPrompts.find({}))
+        prompts = {}
+        for category in categories:
+            for sub_category in category.get("subCategories", []):
+                prompts[(category["id"], sub_category["id"])] = sub_category["prompt"]
+        self._categories, self._prompts = categories, prompts
+        self._loaded_at = time.monotonic()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            self._refreshing.release()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None:
+            self.refresh()
+        elif time.monotonic() - self._loaded_at > self.ttl:
+            if self._refreshing.acquire(blocking=False):
+                threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def get_categories(self):
+        self._ensure_loaded()
+        return self._categories
+
+    def get_prompt(self, category_id, sub_category_id):
+        self._ensure_loaded()
+        return self._prompts.get((category_id, sub_category_id))
+
+
+system_prompts = SystemPromptCatalogue(
+    ttl=int(settings.get("SYSTEM_PROMPTS_TTL", 300))
+)
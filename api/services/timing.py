@@ -0,0 +1,27 @@
+import time
+
+
+class StageTimer:
+    """
+    Wall time of the named stages of a request, stages may overlap
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._started = time.perf_counter()
+
+    async def run(self, name, awaitable):
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.stages[name] = time.perf_counter() - started
+
+    def server_timing(self):
+        """
+        Value for a Server-Timing header, durations in milliseconds
+        """
+        stages = dict(self.stages, total=time.perf_counter() - self._started)
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items()
+        )
@@ -0,0 +1,106 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import settings
+from database.database import samuraiChatHistory
+from get_logger import logger
+from services.upstream import upstream
+
+
+def get_titles_starting_with(samurai_id, title, exclude_chat_id=None):
+    """
+    Titles of the user's chats that start with `title`, answered from the
+    (samurai_id, chat_title, chat_id) index without reading the chats
+    """
+    query = {
+        "samurai_id": samurai_id,
+        "chat_title": {"$regex": f"^{re.escape(title)}"},
+    }
+    if exclude_chat_id is not None:
+        query["chat_id"] = {"$ne": exclude_chat_id}
+    cursor = samuraiChatHistory.find(query, projection={"_id": 0, "chat_title": 1})
+    return {chat["chat_title"] for chat in cursor}
+
+
+def dedupe_title(samurai_id, title, chat_id=None):
+    """
+    Adds a (2), (3)... suffix when the user already has a chat named `title`
+    """
+    existing_titles = get_titles_starting_with(samurai_id, title, chat_id)
+    if title not in existing_titles:
+        return title
+    suffix = 2
+    while f"{title} ({suffix})" in existing_titles:
+        suffix += 1
+    return f"{title} ({suffix})"
+
+
+def get_title_messages(paragraph):
+    title_prompt = "generate a topic name for given paragraphs, topic or title should be less than 6 words, and should give a basic sum up of the paragraph."
+    return [
+        {"role": "system", "content": title_prompt},
+        {"role": "user", "content": paragraph},
+    ]
+
+
+def title_generator(paragraph):
+    answer = upstream.chat_completion(get_title_messages(paragraph))
+    title = answer["choices"][0]["message"]["content"]
+    return title.replace('"', "").strip()
+
+
+def provisional_title(question, words=6):
+    """
+    Title saved with the first message until the generated one is ready
+    """
+    title = " ".join(question.split()[:words])
+    return title or "New Chat"
+
+
+class TitleJobs:
+    """
+    Generates chat titles in a thread pool after the first answer is sent.
+    The title is only written while the chat still has its provisional
+    title, so a name set by the user in the meantime is kept.
+    """
+
+    def __init__(self, workers, retries, backoff):
+        self.retries = retries
+        self.backoff = backoff
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="title-jobs"
+        )
+
+    def submit(self, samurai_id, chat_id, paragraph, current_title):
+        return self._executor.submit(
+            self._generate, samurai_id, chat_id, paragraph, current_title
+        )
+
+    def _generate(self, samurai_id, chat_id, paragraph, current_title):
+        for attempt in range(self.retries + 1):
+            try:
+                title = dedupe_title(samurai_id, title_generator(paragraph), chat_id)
+                samuraiChatHistory.update_one(
+                    filter={
+                        "samurai_id": samurai_id,
+                        "chat_id": chat_id,
+                        "chat_title": current_title,
+                    },
+                    update={"$set": {"chat_title": title}},
+                )
+                return title
+            except Exception as error:
+                logger.error(f"title generation for chat {chat_id} failed: {error}")
+                if attempt < self.retries:
+                    time.sleep(self.backoff * 2**attempt)
+        return None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+title_jobs = TitleJobs(
+    workers=int(settings.get("TITLE_JOB_WORKERS", 4)),
+    retries=int(settings.get("TITLE_JOB_RETRIES", 2)),
+    backoff=float(settings.get("TITLE_JOB_BACKOFF", 1)),
+)
@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from config.openai import openai
+from config.settings import settings
+
+
+class UpstreamClient:
+    """
+    Pooled keep-alive HTTP sessions shared by every upstream call.
+
+    The requests session is installed as openai.requestssession, so helper
+    functions calling openai directly reuse the same connections. Async
+    calls get an aiohttp session created on first use in the event loop.
+
+    `pool_size` is how many idle connections are kept alive per host, it
+    does not cap concurrent requests. A streamed answer holds its
+    connection until it is done, so async connections are only capped by
+    `stream_limit` per host, 0 for no cap.
+    """
+
+    def __init__(self, pool_size, timeout, keepalive_timeout, stream_limit=0):
+        self.pool_size = pool_size
+        self.stream_limit = stream_limit
+        self.timeout = timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.metrics = Counter()
+        self._lock = threading.Lock()
+        self._adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self._aiosession = None
+        openai.requestssession = self.session
+
+    def _start(self, kind):
+        with self._lock:
+            self.metrics[f"{kind}_requests"] += 1
+            self.metrics["in_flight"] += 1
+            self.metrics["max_in_flight"] = max(
+                self.metrics["max_in_flight"], self.metrics["in_flight"]
+            )
+        return time.perf_counter()
+
+    def _finish(self, kind, started, failed=False):
+        with self._lock:
+            self.metrics["in_flight"] -= 1
+            self.metrics[f"{kind}_seconds"] += time.perf_counter() - started
+            if failed:
+                self.metrics[f"{kind}_errors"] += 1
+
+    @contextmanager
+    def _track(self, kind):
+        started = self._start(kind)
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._finish(kind, started, failed)
+
+    def _track_stream(self, kind, stream, started):
+        """
+        Keeps a streamed response counted as in flight until it is closed
+        """
+        failed = False
+        try:
+            yield from stream
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._finish(kind, started, failed)
+
+    async def _atrack_stream(self, kind, stream, started):
+        failed = False
+        try:
+            async for chunk in stream:
+                yield chunk
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+            self._finish(kind, started, failed)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.metrics)
+
+    def aiosession(self):
+        if self._aiosession is None or self._aiosession.closed:
+            connector = aiohttp.TCPConnector(
+                limit=0,
+                limit_per_host=self.stream_limit,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._aiosession = aiohttp.ClientSession(connector=connector)
+        return self._aiosession
+
+    def chat_completion(self, messages, stream=False, **kwargs):
+        started = self._start("completion")
+        try:
+            response = openai.ChatCompletion.create(
+                model=settings["GPT_MODEL"],
+                messages=messages,
+                stream=stream,
+                request_timeout=self.timeout,
+                **kwargs,
+            )
+        except Exception:
+            self._finish("completion", started, failed=True)
+            raise
+        if stream:
+            return self._track_stream("completion", response, started)
+        self._finish("completion", started)
+        return response
+
+    async def achat_completion(self, messages, stream=False, **kwargs):
+        started = self._start("completion")
+        token = openai.aiosession.set(self.aiosession())
+        try:
+            response = await openai.ChatCompletion.acreate(
+                model=settings["GPT_MODEL"],
+                messages=messages,
+                stream=stream,
+                request_timeout=self.timeout,
+                **kwargs,
+            )
+        except Exception:
+            self._finish("completion", started, failed=True)
+            raise
+        finally:
+            openai.aiosession.reset(token)
+        if stream:
+            return self._atrack_stream("completion", response, started)
+        self._finish("completion", started)
+        return response
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        with self._track("http"):
+            return self.session.get(url, **kwargs)
+
+    def pool_stats(self):
+        """
+        Connection pool usage per upstream host
+        """
+        stats = {}
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            stats[pool.host] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle_connections": pool.pool.qsize() if pool.pool else 0,
+                "max_connections": pool.pool.maxsize if pool.pool else 0,
+            }
+        if self._aiosession is not None and not self._aiosession.closed:
+            connector = self._aiosession.connector
+            stats["async"] = {
+                "limit_per_host": connector.limit_per_host,
+                "acquired": len(connector._acquired),
+            }
+        return stats
+
+    async def close(self):
+        if self._aiosession is not None:
+            await self._aiosession.close()
+        self.session.close()
+
+
+upstream = UpstreamClient(
+    pool_size=int(settings.get("UPSTREAM_POOL_SIZE", 50)),
+    timeout=float(settings.get("UPSTREAM_TIMEOUT", 60)),
+    keepalive_timeout=float(settings.get("UPSTREAM_KEEPALIVE_TIMEOUT", 30)),
+    stream_limit=int(settings.get("UPSTREAM_STREAM_LIMIT", 0)),
+)
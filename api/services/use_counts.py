@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import Counter
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from config.settings import settings
+from database.database import samuraiSystemPrompts
+from get_logger import logger
+
+
+class UseCountAggregator:
+    """
+    Collects system prompt use_count increments in memory and writes them
+    with one bulk_write every `interval` seconds, or sooner once
+    `max_pending` increments are waiting. At most one interval of counts
+    is lost if the process dies without a shutdown.
+    """
+
+    def __init__(self, interval, max_pending):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.metrics = {
+            "flushes": 0,
+            "failed_flushes": 0,
+            "flushed_increments": 0,
+            "last_flush_size": 0,
+            "last_flush_seconds": 0.0,
+        }
+        self._pending = Counter()
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def increment(self, category_id, sub_category_id):
+        with self._lock:
+            self._pending[(category_id, sub_category_id)] += 1
+            self._pending_total += 1
+            if self._pending_total >= self.max_pending:
+                self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._pending_total = 0
+        if not pending:
+            return 0
+        keys = list(pending)
+        operations = [
+            UpdateOne(
+                filter={"id": category_id, "subCategories.id": sub_category_id},
+                update={"$inc": {"subCategories.$.use_count": count, "use_count": count}},
+            )
+            for (category_id, sub_category_id), count in pending.items()
+        ]
+        started = time.perf_counter()
+        try:
+            samuraiSystemPrompts.bulk_write(operations, ordered=False)
+        except BulkWriteError as error:
+            # unordered writes, only the failed updates are not applied
+            failed = Counter()
+            for write_error in error.details["writeErrors"]:
+                key = keys[write_error["index"]]
+                failed[key] = pending[key]
+            self._requeue(failed)
+            logger.error(f"use_count flush failed for {len(failed)} prompts: {error}")
+            flushed = sum(pending.values()) - sum(failed.values())
+            self.metrics["flushed_increments"] += flushed
+            return flushed
+        except PyMongoError as error:
+            self._requeue(pending)
+            logger.error(f"use_count flush failed: {error}")
+            return 0
+        flushed = sum(pending.values())
+        self.metrics["flushes"] += 1
+        self.metrics["flushed_increments"] += flushed
+        self.metrics["last_flush_size"] = len(operations)
+        self.metrics["last_flush_seconds"] = time.perf_counter() - started
+        return flushed
+
+    def _requeue(self, pending):
+        """
+        Keeps counts that were not written for the next flush
+        """
+        with self._lock:
+            self._pending.update(pending)
+            self._pending_total += sum(pending.values())
+        self.metrics["failed_flushes"] += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+use_counts = UseCountAggregator(
+    interval=float(settings.get("USE_COUNT_FLUSH_INTERVAL", 5)),
+    max_pending=int(settings.get("USE_COUNT_MAX_PENDING", 1000)),
+)
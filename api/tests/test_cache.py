@@ -0,0 +1,49 @@
+from services import cache
+from services.cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    entries = TTLCache(maxsize=10, ttl=5)
+
+    entries.set("token", "user")
+    clock.now = 4.9
+    assert entries.get("token") == "user"
+    clock.now = 5.1
+    assert entries.get("token") is None
+    assert len(entries) == 0
+    assert (entries.hits, entries.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    entries = TTLCache(maxsize=2, ttl=60)
+
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.get("a")
+    entries.set("c", 3)
+
+    assert entries.get("a") == 1
+    assert entries.get("b") is None
+    assert entries.get("c") == 3
+
+
+def test_discard_where():
+    entries = TTLCache(maxsize=10, ttl=60)
+    entries.set(("alice", "t1"), 1)
+    entries.set(("alice", "t2"), 2)
+    entries.set(("bob", "t1"), 3)
+
+    entries.discard_where(lambda key: key[0] == "alice")
+
+    assert len(entries) == 1
+    assert entries.get(("bob", "t1")) == 3
@@ -0,0 +1,77 @@
+from services.context_window import build_context, count_tokens
+
+
+def message(message_id, role, content, message_type="text", token_count=None):
+    return {
+        "message_id": message_id,
+        "message_role": role,
+        "message_type": message_type,
+        "message_content": content,
+        "message_audio_text": None,
+        "token_count": token_count,
+    }
+
+
+def conversation(pairs, token_count=10):
+    messages = []
+    for index in range(pairs):
+        messages.append(
+            message(2 * index + 1, "user", f"q{index}", token_count=token_count)
+        )
+        messages.append(
+            message(2 * index + 2, "assistant", f"a{index}", token_count=token_count)
+        )
+    return messages
+
+
+def test_keeps_the_latest_messages_within_the_budget():
+    # 14 tokens per message with overhead, 3 pairs fit in 90
+    messages = build_context(conversation(10), token_budget=90)
+
+    assert [m["content"] for m in messages] == ["q7", "a7", "q8", "a8", "q9", "a9"]
+
+
+def test_never_starts_with_an_answer():
+    messages = build_context(conversation(10), token_budget=80)
+
+    assert messages[0]["role"] == "user"
+    assert [m["content"] for m in messages] == ["q8", "a8", "q9", "a9"]
+
+
+def test_keeps_min_messages_over_budget():
+    messages = build_context(conversation(3, token_count=1000), token_budget=10)
+
+    assert [m["content"] for m in messages] == ["q2", "a2"]
+
+
+def test_chat_prompt_comes_first_and_uses_the_budget():
+    prompt = "be brief"
+    budget = 90 + count_tokens(prompt) + 4
+    messages = build_context(conversation(10), chat_prompt=prompt, token_budget=budget)
+
+    assert messages[0] == {"role": "system", "content": prompt}
+    assert len(messages) == 7
+
+
+def test_drops_images_with_their_question():
+    messages = [
+        message(1, "user", "hello", token_count=1),
+        message(2, "assistant", "hi", token_count=1),
+        message(3, "user", "draw a cat", token_count=1),
+        message(4, "assistant", "https://img", message_type="image", token_count=0),
+    ]
+
+    assert [m["content"] for m in build_context(messages)] == ["hello", "hi"]
+
+
+def test_audio_messages_use_their_transcript():
+    audio = message(1, "user", "https://audio", message_type="audio", token_count=2)
+    audio["message_audio_text"] = "spoken question"
+
+    assert build_context([audio]) == [{"role": "user", "content": "spoken question"}]
+
+
+def test_counts_tokens_of_messages_saved_without_a_count():
+    messages = conversation(1, token_count=None)
+
+    assert len(build_context(messages, token_budget=0)) == 2
@@ -0,0 +1,44 @@
+import asyncio
+from io import BytesIO
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from services.image_pipeline import ImagePipeline, parse_variants
+
+
+def png(size=(640, 480), mode="RGBA"):
+    buffer = BytesIO()
+    Image.new(mode, size).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_parse_variants():
+    assert parse_variants("") == ()
+    assert parse_variants("thumb:256:JPEG, mobile:512:webp") == (
+        ("thumb", 256, "jpeg"),
+        ("mobile", 512, "webp"),
+    )
+
+
+@pytest.mark.parametrize(
+    "spec", ["thumb:256:gif", "thumb:wide:jpeg", "thumb:256", "original:256:jpeg"]
+)
+def test_bad_variants_fail_when_parsed(spec):
+    with pytest.raises(ValueError):
+        parse_variants(spec)
+
+
+def test_transcodes_in_spawned_workers():
+    pipeline = ImagePipeline(workers=1, variants=(("thumb", 128, "webp"),))
+    try:
+        images = asyncio.run(pipeline.transcode(png()))
+    finally:
+        pipeline.shutdown()
+
+    extension, original = images["original"]
+    assert extension == "jpeg"
+    assert Image.open(BytesIO(original)).size == (640, 480)
+    extension, thumb = images["thumb"]
+    assert extension == "webp"
+    assert Image.open(BytesIO(thumb)).size == (128, 96)
@@ -0,0 +1,65 @@
+import io
+from services.media_store import FileSystemBackend, MediaStore
+
+
+class CountingBackend(FileSystemBackend):
+    def __init__(self, root):
+        super().__init__(root)
+        self.uploads = []
+
+    def put(self, folder, filename, content):
+        self.uploads.append((folder, filename))
+        return super().put(folder, filename, content)
+
+
+class FakeIndex:
+    def __init__(self):
+        self.documents = {}
+
+    def update_one(self, filter, update, upsert):
+        self.documents.setdefault(filter["_id"], update["$setOnInsert"])
+
+    def find_one(self, filter, projection):
+        return self.documents.get(filter["_id"])
+
+
+def test_same_bytes_are_uploaded_once(tmp_path):
+    backend = CountingBackend(tmp_path)
+    store = MediaStore(backend)
+
+    first = store.put("images", "cat.JPEG", b"cat")
+    second = store.put("images", "other.jpeg", io.BytesIO(b"cat"))
+
+    assert first == second
+    assert len(backend.uploads) == 1
+    ((folder, filename),) = backend.uploads
+    assert filename.endswith(".jpeg")
+    assert (tmp_path / folder / filename).read_bytes() == b"cat"
+    assert store.metrics["uploaded"] == 1
+    assert store.metrics["deduplicated"] == 1
+    assert store.metrics["deduplicated_bytes"] == 3
+
+
+def test_folders_are_stored_separately(tmp_path):
+    backend = CountingBackend(tmp_path)
+    store = MediaStore(backend)
+
+    image = store.put("images", "cat.jpeg", b"cat")
+    audio = store.put("audio", "cat.jpeg", b"cat")
+
+    assert image != audio
+    assert [folder for folder, _ in backend.uploads] == ["images", "audio"]
+    assert store.metrics["uploaded"] == 2
+    assert store.metrics["deduplicated"] == 0
+
+
+def test_links_are_found_in_the_index_after_a_restart(tmp_path):
+    backend = CountingBackend(tmp_path)
+    index = FakeIndex()
+    link = MediaStore(backend, index).put("audio", "question.mp3", b"audio")
+
+    restarted = MediaStore(backend, index)
+
+    assert restarted.put("audio", "question.mp3", b"audio") == link
+    assert len(backend.uploads) == 1
+    assert restarted.metrics["deduplicated"] == 1
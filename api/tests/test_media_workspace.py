@@ -0,0 +1,59 @@
+import io
+import os
+import pytest
+from fastapi import HTTPException
+from services.media_workspace import MediaWorkspace
+
+
+def test_files_live_in_a_private_dir_removed_on_exit(tmp_path):
+    with MediaWorkspace(max_bytes=100, root=str(tmp_path)) as workspace:
+        path = workspace.write("../output.jpeg", b"image")
+        assert os.path.dirname(path) == workspace.path
+        assert open(path, "rb").read() == b"image"
+    assert not os.path.exists(workspace.path)
+
+
+def test_client_content_over_the_limit_is_a_413(tmp_path):
+    with MediaWorkspace(max_bytes=10, root=str(tmp_path)) as workspace:
+        workspace.write("first", b"12345")
+        with pytest.raises(HTTPException) as error:
+            workspace.write("second", io.BytesIO(b"123456"))
+    assert error.value.status_code == 413
+
+
+def test_limit_error_can_be_replaced(tmp_path):
+    def upstream_too_large():
+        raise HTTPException(status_code=502)
+
+    with MediaWorkspace(max_bytes=1, root=str(tmp_path)) as workspace:
+        with pytest.raises(HTTPException) as error:
+            workspace.write("video.mp4", b"12", too_large=upstream_too_large)
+    assert error.value.status_code == 502
+
+
+class Download(io.RawIOBase):
+    """
+    Non-seekable stream counting how much of it was read
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.read_bytes = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        size = min(size, self.size - self.read_bytes)
+        self.read_bytes += size
+        return b"x" * size
+
+
+def test_streamed_downloads_stop_at_the_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr("services.media_workspace.CHUNK_SIZE", 4)
+    download = Download(size=1000)
+
+    with MediaWorkspace(max_bytes=10, root=str(tmp_path)) as workspace:
+        with pytest.raises(HTTPException):
+            workspace.write("video.mp4", download)
+    assert download.read_bytes == 12
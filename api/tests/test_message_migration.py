@@ -0,0 +1,136 @@
+from types import SimpleNamespace
+from services import message_store
+
+
+def legacy_chat():
+    def message(message_id, role, message_type, content):
+        return {
+            "message_id": message_id,
+            "message_role": role,
+            "message_type": message_type,
+            "message_content": content,
+        }
+
+    return {
+        "_id": "chat-doc",
+        "samurai_id": "samurai",
+        "chat_id": "chat",
+        "messages": [
+            message(1, "user", "text", "hello"),
+            message(2, "assistant", "text", "hi"),
+            # legacy image answers shared the id of their question
+            message(3, "user", "text", "draw a cat"),
+            message(3, "assistant", "image", "https://img/cat.jpeg"),
+            message(4, "user", "text", "thanks"),
+            message(5, "assistant", "text", "welcome"),
+        ],
+    }
+
+
+class FakeMessages:
+    def __init__(self, fail=False):
+        self.documents = {}
+        self.fail = fail
+
+    def bulk_write(self, operations, ordered):
+        upserted_ids = {}
+        for position, operation in enumerate(operations):
+            key = (operation._filter["chat_id"], operation._filter["message_id"])
+            if key not in self.documents and not self.fail:
+                self.documents[key] = operation._doc["$setOnInsert"]
+                upserted_ids[position] = key
+        return SimpleNamespace(upserted_ids=upserted_ids)
+
+    def find(self, filter, projection):
+        return [
+            document
+            for (chat_id, message_id), document in self.documents.items()
+            if chat_id == filter["chat_id"] and message_id in filter["message_id"]["$in"]
+        ]
+
+
+class FakeChats:
+    def __init__(self, chats, changed=False):
+        self.chats = chats
+        self.changed = changed
+        self.updates = []
+
+    def find(self, filter, projection, batch_size):
+        return [chat for chat in self.chats if chat.get("messages")]
+
+    def update_one(self, filter, update):
+        if self.changed:
+            return SimpleNamespace(modified_count=0)
+        self.updates.append(update)
+        return SimpleNamespace(modified_count=1)
+
+    def update_many(self, filter, update):
+        pass
+
+
+def migrate(monkeypatch, messages, chats=None):
+    chats = chats or FakeChats([legacy_chat()])
+    monkeypatch.setattr(message_store, "samuraiChatMessages", messages)
+    monkeypatch.setattr(message_store, "samuraiChatHistory", chats)
+    return message_store.migrate_embedded_messages(), chats
+
+
+def test_duplicate_ids_are_renumbered_and_nothing_is_lost(monkeypatch):
+    messages = FakeMessages()
+
+    migrated, chats = migrate(monkeypatch, messages)
+
+    assert migrated == 1
+    assert len(messages.documents) == 6
+    assert messages.documents[("chat", 4)]["message_content"] == "https://img/cat.jpeg"
+    (update,) = chats.updates
+    counters, unset = update
+    assert counters["$set"]["last_message_id"]["$max"][1] == 6
+    assert counters["$set"]["message_count"]["$add"][1] == 6
+    last_message = counters["$set"]["last_message"]["$cond"][2]["$literal"]
+    assert last_message["message_content"] == "welcome"
+    assert unset == {"$unset": "messages"}
+
+
+def test_chats_keep_their_array_unless_every_message_was_copied(monkeypatch):
+    migrated, chats = migrate(monkeypatch, FakeMessages(fail=True))
+
+    assert migrated == 0
+    assert chats.updates == []
+
+
+def test_ids_taken_by_newer_messages_are_not_counted_as_copied(monkeypatch):
+    messages = FakeMessages()
+    # saved by the new API before the chat was migrated
+    messages.documents[("chat", 1)] = {"message_id": 1, "message_content": "new"}
+
+    migrated, chats = migrate(monkeypatch, messages)
+
+    assert migrated == 0
+    assert chats.updates == []
+    assert messages.documents[("chat", 1)]["message_content"] == "new"
+
+
+def test_running_again_finishes_chats_already_copied(monkeypatch):
+    messages = FakeMessages()
+    migrate(monkeypatch, messages, FakeChats([legacy_chat()], changed=True))
+
+    migrated, chats = migrate(monkeypatch, messages)
+
+    assert migrated == 1
+    assert len(chats.updates) == 1
+
+
+def test_chats_changed_while_copied_keep_their_array(monkeypatch):
+    migrated, chats = migrate(
+        monkeypatch, FakeMessages(), FakeChats([legacy_chat()], changed=True)
+    )
+
+    assert migrated == 0
+    assert chats.updates == []
+
+
+def test_chats_without_duplicates_keep_their_ids():
+    messages = legacy_chat()["messages"][:3]
+
+    assert message_store.renumber_duplicate_ids(messages) is messages
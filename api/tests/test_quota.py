@@ -0,0 +1,144 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fastapi import HTTPException
+from services import quota
+from services.quota import QueryQuota
+
+
+def evaluate(expression, document):
+    """
+    The aggregation operators QueryQuota uses, evaluated in Python
+    """
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = document
+        for key in expression[1:].split("."):
+            value = value[key]
+        return value
+    if not isinstance(expression, dict):
+        return expression
+    (operator, arguments), = expression.items()
+    values = [evaluate(argument, document) for argument in arguments]
+    if operator == "$cond":
+        return values[1] if values[0] else values[2]
+    if operator == "$and":
+        return all(values)
+    if operator == "$eq":
+        return values[0] == values[1]
+    if operator == "$gt":
+        return values[0] > values[1]
+    if operator == "$max":
+        return max(values)
+    if operator == "$subtract":
+        return values[0] - values[1]
+    raise NotImplementedError(operator)
+
+
+class FakeUsers:
+    """
+    samuraiUser with find_one_and_update applied atomically, like mongod
+    does for a single document
+    """
+
+    def __init__(self, users):
+        self.users = users
+        self.lowest_free_queries = min(
+            user["subscription"]["free_queries"] for user in users.values()
+        )
+        self._lock = threading.Lock()
+
+    def find_one_and_update(self, filter, update, projection):
+        with self._lock:
+            user = self.users.get(filter["samurai_id"])
+            if user is None:
+                return None
+            before = {"subscription": dict(user["subscription"])}
+            for stage in update:
+                for path, expression in stage["$set"].items():
+                    section, key = path.split(".")
+                    user[section][key] = evaluate(expression, before)
+            self.lowest_free_queries = min(
+                self.lowest_free_queries, user["subscription"]["free_queries"]
+            )
+            return before
+
+    def bulk_write(self, operations, ordered):
+        with self._lock:
+            for operation in operations:
+                user = self.users[operation._filter["samurai_id"]]
+                user["subscription"]["free_queries"] += operation._doc["$inc"][
+                    "subscription.free_queries"
+                ]
+
+
+@pytest.fixture
+def users(monkeypatch):
+    users = FakeUsers(
+        {
+            "free": {"subscription": {"active": False, "free_queries": 100}},
+            "paid": {"subscription": {"active": True, "free_queries": 0}},
+        }
+    )
+    monkeypatch.setattr(quota, "samuraiUser", users)
+    return users
+
+
+def consume_in_parallel(query_quota, samurai_id, requests=500):
+    def consume(_):
+        try:
+            query_quota.consume(samurai_id)
+            return True
+        except HTTPException as error:
+            assert error.status_code == 402, error
+            return False
+
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        return sum(pool.map(consume, range(requests)))
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 7])
+def test_parallel_requests_never_overdraw(users, block_size):
+    query_quota = QueryQuota(block_size=block_size)
+
+    served = consume_in_parallel(query_quota, "free")
+
+    assert served == 100
+    assert users.lowest_free_queries == 0
+    assert users.users["free"]["subscription"]["free_queries"] == 0
+
+
+def test_unused_reservations_are_given_back(users):
+    query_quota = QueryQuota(block_size=10)
+
+    served = consume_in_parallel(query_quota, "free", requests=25)
+    query_quota.release_all()
+
+    assert served == 25
+    assert users.users["free"]["subscription"]["free_queries"] == 75
+
+
+def test_reservation_is_capped_by_free_queries(users):
+    users.users["free"]["subscription"]["free_queries"] = 3
+    query_quota = QueryQuota(block_size=5)
+
+    for _ in range(3):
+        query_quota.consume("free")
+    with pytest.raises(HTTPException):
+        query_quota.consume("free")
+
+    assert users.users["free"]["subscription"]["free_queries"] == 0
+    query_quota.release_all()
+    assert users.users["free"]["subscription"]["free_queries"] == 0
+
+
+def test_active_subscriptions_are_not_limited(users):
+    query_quota = QueryQuota(block_size=5)
+
+    assert consume_in_parallel(query_quota, "paid") == 500
+    assert users.users["paid"]["subscription"]["free_queries"] == 0
+
+
+def test_unknown_user(users):
+    with pytest.raises(HTTPException) as error:
+        QueryQuota().consume("missing")
+    assert error.value.status_code == 404
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from services import speech
+from services.speech import SentenceSplitter, SpeechQueue
+
+
+def split(text, min_chars=1, step=3):
+    splitter = SentenceSplitter(min_chars=min_chars)
+    sentences = []
+    for index in range(0, len(text), step):
+        sentences.extend(splitter.add(text[index : index + step]))
+    return sentences, splitter.flush()
+
+
+def test_splits_streamed_text_at_sentence_ends():
+    sentences, rest = split("Hello there. How are you? I am fine! Bye")
+
+    assert sentences == ["Hello there.", "How are you?", "I am fine!"]
+    assert rest == "Bye"
+
+
+def test_does_not_split_inside_numbers():
+    sentences, rest = split("Pi is 3.14 roughly. Done")
+
+    assert sentences == ["Pi is 3.14 roughly."]
+    assert rest == "Done"
+
+
+def test_short_sentences_are_joined():
+    sentences, rest = split("Yes. No. This one is long enough. Ok", min_chars=10)
+
+    assert sentences == ["Yes. No. This one is long enough."]
+    assert rest == "Ok"
+
+
+def test_newlines_end_sentences():
+    sentences, rest = split("first line\nsecond line\n", step=50)
+
+    assert sentences == ["first line", "second line"]
+    assert rest is None
+
+
+def test_speech_queue_keeps_sentence_order(monkeypatch):
+    def synthesize(text, language):
+        # later sentences finish first
+        time.sleep(0.01 * (3 - len(text) % 3))
+        return text.encode()
+
+    monkeypatch.setattr(speech, "synthesize", synthesize)
+
+    async def scenario():
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            queue = SpeechQueue(executor, "en-US", max_pending=2)
+            for sentence in ["a", "bb", "ccc", "dddd"]:
+                await queue.put(sentence)
+            return await queue.drain()
+
+    results = asyncio.run(scenario())
+    assert [text for text, _ in results] == ["a", "bb", "ccc", "dddd"]
+    assert [audio for _, audio in results] == [b"a", b"bb", b"ccc", b"dddd"]
@@ -0,0 +1,98 @@
+import asyncio
+import pytest
+from services.stream_broker import StreamBroker, StreamInterrupted
+
+
+async def source(count, delay=0.0, fail_after=None):
+    for index in range(count):
+        if fail_after is not None and index == fail_after:
+            raise ValueError("upstream broke")
+        await asyncio.sleep(delay)
+        yield index
+
+
+async def read(subscription, limit=None):
+    chunks = []
+    async for chunk in subscription:
+        chunks.append(chunk)
+        if limit is not None and len(chunks) == limit:
+            await subscription.aclose()
+            break
+    return chunks
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_subscribers_share_one_upstream():
+    async def scenario():
+        broker = StreamBroker(max_buffered=100)
+        opened = []
+
+        def open_source():
+            opened.append(True)
+            return source(10, delay=0.001)
+
+        first = broker.subscribe("key", open_source)
+        second = broker.subscribe("key", open_source)
+        return await asyncio.gather(read(first), read(second)), opened
+
+    (first, second), opened = run(scenario())
+    assert first == second == list(range(10))
+    assert len(opened) == 1
+
+
+def test_follower_keeps_the_stream_when_the_leader_leaves_early():
+    async def scenario():
+        broker = StreamBroker(max_buffered=100)
+        leader = broker.subscribe("key", lambda: source(10, delay=0.001))
+        follower = broker.subscribe("key", lambda: source(10))
+        await read(leader, limit=2)
+        await asyncio.sleep(0.01)
+        return await read(follower)
+
+    assert run(scenario()) == list(range(10))
+
+
+def test_slow_subscriber_is_interrupted():
+    async def scenario():
+        broker = StreamBroker(max_buffered=5)
+        slow = broker.subscribe("key", lambda: source(30))
+        await asyncio.sleep(0.05)
+        return await read(slow)
+
+    with pytest.raises(StreamInterrupted):
+        run(scenario())
+
+
+def test_upstream_errors_reach_every_subscriber():
+    async def scenario():
+        broker = StreamBroker(max_buffered=100)
+        first = broker.subscribe("key", lambda: source(10, fail_after=3))
+        second = broker.subscribe("key", lambda: source(10))
+        return await asyncio.gather(
+            read(first), read(second), return_exceptions=True
+        )
+
+    results = run(scenario())
+    assert all(isinstance(result, StreamInterrupted) for result in results)
+    assert all(isinstance(result.__cause__, ValueError) for result in results)
+
+
+def test_upstream_is_cancelled_when_every_subscriber_leaves():
+    async def scenario():
+        broker = StreamBroker(max_buffered=100)
+        pulled = []
+
+        async def tracked():
+            async for chunk in source(100, delay=0.001):
+                pulled.append(chunk)
+                yield chunk
+
+        subscription = broker.subscribe("key", tracked)
+        await read(subscription, limit=2)
+        await asyncio.sleep(0.02)
+        return pulled
+
+    assert len(run(scenario())) < 100
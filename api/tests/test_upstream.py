@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+from services.upstream import UpstreamClient
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = UpstreamClient(pool_size=2, timeout=1, keepalive_timeout=1)
+    monkeypatch.setattr("services.upstream.openai", FakeOpenAI())
+    return client
+
+
+class FakeCompletion:
+    @staticmethod
+    def create(stream=False, **kwargs):
+        if stream:
+            return iter(["a", "b"])
+        return {"choices": []}
+
+    @staticmethod
+    async def acreate(stream=False, **kwargs):
+        async def chunks():
+            yield "a"
+            yield "b"
+
+        return chunks() if stream else {"choices": []}
+
+
+class FakeOpenAI:
+    ChatCompletion = FakeCompletion
+
+    class aiosession:
+        @staticmethod
+        def set(session):
+            return None
+
+        @staticmethod
+        def reset(token):
+            pass
+
+
+def test_streams_count_as_in_flight_until_consumed(client):
+    stream = client.chat_completion([], stream=True)
+    assert client.snapshot()["in_flight"] == 1
+
+    assert list(stream) == ["a", "b"]
+    assert client.snapshot()["in_flight"] == 0
+    assert client.snapshot()["completion_requests"] == 1
+
+
+def test_plain_completions_finish_immediately(client):
+    client.chat_completion([])
+    assert client.snapshot()["in_flight"] == 0
+
+
+def test_async_streams_are_tracked_until_closed(client, monkeypatch):
+    monkeypatch.setattr(client, "aiosession", lambda: None)
+
+    async def run():
+        stream = await client.achat_completion([], stream=True)
+        assert client.snapshot()["in_flight"] == 1
+        async for _ in stream:
+            break
+        await stream.aclose()
+
+    asyncio.run(run())
+    assert client.snapshot()["in_flight"] == 0
+    assert client.snapshot().get("completion_errors", 0) == 0
+
+
+def test_async_connections_are_not_capped_by_the_keepalive_pool(client):
+    async def run():
+        session = client.aiosession()
+        try:
+            return session.connector.limit, session.connector.limit_per_host
+        finally:
+            await client.close()
+
+    assert asyncio.run(run()) == (0, 0)
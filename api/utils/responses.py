@@ -0,0 +1,29 @@
+import orjson
+from bson import json_util
+from fastapi.responses import JSONResponse
+from pymongo.command_cursor import CommandCursor
+from pymongo.cursor import Cursor
+
+
+def encode_bson(obj):
+    """
+    orjson fallback for values it can not encode itself, cursors are
+    consumed in place and BSON types use the same extended JSON as
+    bson.json_util.dumps
+    """
+    if isinstance(obj, (Cursor, CommandCursor)):
+        return list(obj)
+    return json_util.default(obj)
+
+
+class BSONResponse(JSONResponse):
+    """
+    Compact JSON response for content holding Mongo documents or cursors
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content,
+            default=encode_bson,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )